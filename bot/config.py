@@ -1,20 +1,142 @@
 
 import os
-from dataclasses import dataclass
-from dotenv import load_dotenv
+from dataclasses import dataclass, field
+
+_ENV_LOADED = False
+_BOOTSTRAPPED = False
+
+
+def load_env():
+    """Один раз читает .env в окружение (python-dotenv импортируется только здесь)."""
+    global _ENV_LOADED
+    if _ENV_LOADED:
+        return
+    _ENV_LOADED = True
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.getcwd(), ".env"))
+
+
+# счётчики, реклама и пиксели — на данные товара не влияют
+TRACKER_DOMAINS = ("mc.yandex.ru,an.yandex.ru,yandexadexchange.net,adfox.ru,top-fwz1.mail.ru,"
+             "googletagmanager.com,google-analytics.com,doubleclick.net,criteo.com,"
+             "mytarget.ru,vk.com,tiktok.com,facebook.net")
+# картинки по-прежнему видны в DOM (src/srcset), скачивать их браузеру не нужно
+BLOCK_TYPES = "image,media,font"
+
+
+def _flag(v: str) -> bool:
+    return v == "1"
+
+
+def _env(name: str, default: str, cast=str):
+    # значение читается при создании Settings(), а не при импорте модуля
+    return field(default_factory=lambda: cast(os.getenv(name, default)))
 
-load_dotenv(os.path.join(os.getcwd(), ".env"))
 
 @dataclass
 class Settings:
-    bot_token: str = os.getenv("BOT_TOKEN", "")
-    channel_username: str = os.getenv("CHANNEL_USERNAME", "")
-    show_browser: bool = os.getenv("SHOW_BROWSER", "0") == "1"
-    slow_mo_ms: int = int(os.getenv("SLOW_MO", "250"))
-    debug_dir: str = os.getenv("DEBUG_DIR", "debug")
-    playwright_timeout_ms: int = int(os.getenv("PW_TIMEOUT_MS", "35000"))
-    wait_jsonld_ms: int = int(os.getenv("WAIT_JSONLD_MS", "14000"))
-    http_timeout: float = float(os.getenv("HTTP_TIMEOUT", "12.0"))
-    total_images_limit: int = int(os.getenv("TOTAL_IMAGES_LIMIT", "50"))
-
-settings = Settings()
+    bot_token: str = _env("BOT_TOKEN", "")
+    channel_username: str = _env("CHANNEL_USERNAME", "")
+    show_browser: bool = _env("SHOW_BROWSER", "0", _flag)
+    slow_mo_ms: int = _env("SLOW_MO", "250", int)
+    debug_dir: str = _env("DEBUG_DIR", "debug")
+    playwright_timeout_ms: int = _env("PW_TIMEOUT_MS", "35000", int)
+    # общий дедлайн ожидания данных на странице (LD+JSON, state-*, composer), по сайтам
+    pw_ready_ms_ozon: int = _env("PW_READY_MS_OZON", "8000", int)
+    pw_ready_ms_wb: int = _env("PW_READY_MS_WB", "8000", int)
+    http_timeout: float = _env("HTTP_TIMEOUT", "12.0", float)
+    # общие пулы HTTP-клиентов (см. utils/http.py)
+    http_max_connections: int = _env("HTTP_MAX_CONNECTIONS", "20", int)
+    http_keepalive: int = _env("HTTP_KEEPALIVE", "10", int)
+    steam_timeout_s: float = _env("STEAM_TIMEOUT_S", "15", float)
+    cheapshark_timeout_s: float = _env("CHEAPSHARK_TIMEOUT_S", "20", float)
+    media_timeout_s: float = _env("MEDIA_TIMEOUT_S", "25", float)
+    # проверка цен: воркеры, лимиты провайдеров, повторы
+    scheduler_workers: int = _env("SCHEDULER_WORKERS", "16", int)
+    scheduler_page_size: int = _env("SCHEDULER_PAGE_SIZE", "500", int)
+    scheduler_idle_s: float = _env("SCHEDULER_IDLE_S", "60", float)
+    # адаптивные интервалы проверки трека, сек
+    check_interval_s: int = _env("CHECK_INTERVAL_S", "3600", int)
+    check_min_interval_s: int = _env("CHECK_MIN_INTERVAL_S", "900", int)
+    check_max_interval_s: int = _env("CHECK_MAX_INTERVAL_S", "43200", int)
+    check_retry_s: int = _env("CHECK_RETRY_S", "600", int)
+    check_near_target: float = _env("CHECK_NEAR_TARGET", "0.1", float)
+    # история цен
+    history_downsample_days: int = _env("HISTORY_DOWNSAMPLE_DAYS", "30", int)
+    history_retention_days: int = _env("HISTORY_RETENTION_DAYS", "365", int)
+    history_notify_days: int = _env("HISTORY_NOTIFY_DAYS", "90", int)
+    steam_rps: float = _env("STEAM_RPS", "0.6", float)
+    steam_burst: int = _env("STEAM_BURST", "5", int)
+    steam_batch_size: int = _env("STEAM_BATCH_SIZE", "50", int)
+    cheapshark_rps: float = _env("CHEAPSHARK_RPS", "1.0", float)
+    cheapshark_burst: int = _env("CHEAPSHARK_BURST", "5", int)
+    price_retries: int = _env("PRICE_RETRIES", "3", int)
+    price_retry_base_s: float = _env("PRICE_RETRY_BASE_S", "1.0", float)
+    # отложенная пакетная запись цен в БД
+    db_batch_size: int = _env("DB_BATCH_SIZE", "500", int)
+    db_flush_interval_s: float = _env("DB_FLUSH_INTERVAL_S", "2.0", float)
+    total_images_limit: int = _env("TOTAL_IMAGES_LIMIT", "50", int)
+    # пул браузеров Playwright
+    pw_pool_size: int = _env("PW_POOL_SIZE", "2", int)
+    pw_recycle_pages: int = _env("PW_RECYCLE_PAGES", "50", int)
+    pw_queue_size: int = _env("PW_QUEUE_SIZE", "16", int)
+    pw_queue_wait_s: float = _env("PW_QUEUE_WAIT_S", "10", float)
+    warmup_timeout_s: float = _env("WARMUP_TIMEOUT_S", "30", float)
+    # сессии браузера (куки, localStorage) по сайту и слоту пула; ротация по возрасту и при бане
+    pw_state_dir: str = _env("PW_STATE_DIR", "data/pw_state")
+    pw_state_ttl_s: float = _env("PW_STATE_TTL_S", str(3 * 86400), float)
+    pw_state_save_s: float = _env("PW_STATE_SAVE_S", "60", float)
+    # перехват запросов страницы: типы ресурсов и домены через запятую, по сайтам
+    pw_block_enabled: bool = _env("PW_BLOCK", "1", _flag)
+    pw_block_types_ozon: str = _env("PW_BLOCK_TYPES_OZON", BLOCK_TYPES)
+    pw_block_types_wb: str = _env("PW_BLOCK_TYPES_WB", BLOCK_TYPES)
+    pw_block_domains_ozon: str = _env("PW_BLOCK_DOMAINS_OZON", TRACKER_DOMAINS)
+    pw_block_domains_wb: str = _env("PW_BLOCK_DOMAINS_WB", TRACKER_DOMAINS)
+    pw_allow_domains_ozon: str = _env("PW_ALLOW_DOMAINS_OZON", "")
+    pw_allow_domains_wb: str = _env("PW_ALLOW_DOMAINS_WB", "")
+    # скриншоты: off — никогда, fail — только при неудаче, always — каждый раз (отладка)
+    pw_screenshots: str = _env("PW_SCREENSHOTS", "fail")
+    # Ozon: прямой запрос composer-api с куками тёплого браузера (без рендера страницы)
+    ozon_direct: bool = _env("OZON_DIRECT", "1", _flag)
+    ozon_direct_timeout_s: float = _env("OZON_DIRECT_TIMEOUT_S", "8", float)
+    ozon_direct_backoff_s: float = _env("OZON_DIRECT_BACKOFF_S", "300", float)
+    # card.wb.ru: параллельный опрос
+    wb_api_concurrency: int = _env("WB_API_CONCURRENCY", "6", int)
+    wb_api_timeout_s: float = _env("WB_API_TIMEOUT_S", "6", float)
+    wb_api_deadline_s: float = _env("WB_API_DEADLINE_S", "10", float)
+    # basket-XX: таблица vol -> корзина и фоллбек-перебор
+    wb_basket_table_path: str = _env("WB_BASKET_TABLE", "data/wb_baskets.json")
+    wb_basket_head_timeout_s: float = _env("WB_BASKET_HEAD_TIMEOUT_S", "3", float)
+    wb_basket_probe_concurrency: int = _env("WB_BASKET_PROBE_CONCURRENCY", "16", int)
+    wb_basket_probe_deadline_s: float = _env("WB_BASKET_PROBE_DEADLINE_S", "6", float)
+    # кэш распарсенных товаров
+    product_cache_path: str = _env("PRODUCT_CACHE_PATH", "data/cache.sqlite3")
+    product_cache_items: int = _env("PRODUCT_CACHE_ITEMS", "512", int)
+    product_price_ttl_s: float = _env("PRODUCT_PRICE_TTL_S", "900", float)
+    product_static_ttl_s: float = _env("PRODUCT_STATIC_TTL_S", "604800", float)
+    # кэш картинок (по содержимому) и file_id Telegram
+    media_cache_dir: str = _env("MEDIA_CACHE_DIR", "downloads/cas")
+    media_cache_db: str = _env("MEDIA_CACHE_DB", "data/media.sqlite3")
+    media_cache_max_mb: int = _env("MEDIA_CACHE_MAX_MB", "500", int)
+    media_max_bytes: int = _env("MEDIA_MAX_BYTES", str(10 * 1024 * 1024), int)
+    media_chunk_bytes: int = _env("MEDIA_CHUNK_BYTES", "65536", int)
+
+
+def __getattr__(name: str):
+    # settings создаются при первом обращении: .env читается один раз и только когда нужен
+    if name == "settings":
+        load_env()
+        s = globals()["settings"] = Settings()
+        return s
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def bootstrap():
+    """Единая инициализация процесса: .env и логирование. Повторные вызовы ничего не делают."""
+    global _BOOTSTRAPPED
+    if _BOOTSTRAPPED:
+        return
+    _BOOTSTRAPPED = True
+    load_env()
+    from .utils.logging import setup_logging
+    setup_logging()
@@ -1,8 +1,13 @@
 
+import asyncio, contextlib, logging, os
 import aiosqlite
-from typing import Optional, List, Tuple, Any
+from dataclasses import fields
+from typing import AsyncIterator, Optional, List, Tuple, Any
+from .config import settings
 from .models import Track
 
+log = logging.getLogger("bot.db")
+
 DB_PATH = "data/db.sqlite3"
 
 CREATE_SQL = '''
@@ -22,64 +27,276 @@ CREATE TABLE IF NOT EXISTS tracks (
   last_price_cents INTEGER,
   last_notified_price_cents INTEGER,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-  last_checked_at TIMESTAMP
+  last_checked_at TIMESTAMP,
+  next_check_at INTEGER NOT NULL DEFAULT 0,   -- epoch, когда проверять снова
+  check_interval_s INTEGER                    -- последний выбранный интервал
 );
 CREATE INDEX IF NOT EXISTS idx_tracks_user ON tracks(user_id);
 CREATE INDEX IF NOT EXISTS idx_tracks_mode ON tracks(mode);
+-- история цен по ключу игры (см. models.track_key): пишем только изменения
+CREATE TABLE IF NOT EXISTS price_history (
+  track_key TEXT NOT NULL,
+  ts INTEGER NOT NULL,          -- epoch, сек
+  price_cents INTEGER NOT NULL,
+  PRIMARY KEY (track_key, ts)
+) WITHOUT ROWID;
 '''
 
-async def init_db():
-    import os
-    os.makedirs("data", exist_ok=True)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.executescript(CREATE_SQL)
+# колонки, добавленные после первой версии схемы
+MIGRATIONS = [
+    ("next_check_at", "ALTER TABLE tracks ADD COLUMN next_check_at INTEGER NOT NULL DEFAULT 0"),
+    ("check_interval_s", "ALTER TABLE tracks ADD COLUMN check_interval_s INTEGER"),
+]
+INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_tracks_next_check ON tracks(next_check_at);"
+
+async def _migrate(db: aiosqlite.Connection):
+    cur = await db.execute("PRAGMA table_info(tracks)")
+    cols = {r[1] for r in await cur.fetchall()}
+    for col, sql in MIGRATIONS:
+        if col not in cols:
+            await db.execute(sql)
+    await db.execute(INDEX_SQL)
+
+_TRACK_FIELDS = {f.name for f in fields(Track)}
+
+def _track_fields(row) -> dict:
+    # в таблице есть служебные колонки (created_at, last_checked_at), которых нет в Track
+    return {k: row[k] for k in row.keys() if k in _TRACK_FIELDS}
+
+
+class _Writer:
+    """
+    Отложенная запись цен: UPDATE-ы копятся и уходят пачкой через executemany
+    в одной транзакции — по размеру (max_batch) или по таймеру (interval).
+    """
+
+    def __init__(self, max_batch: int, interval: float):
+        self.max_batch = max_batch
+        self.interval = interval
+        # track_id -> (price_cents, next_check_at, check_interval_s)
+        self._prices: dict[int, tuple] = {}
+        self._notified: dict[int, int] = {}
+        self._next: dict[int, int] = {}
+        self._history: dict[tuple, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._prices) + len(self._notified) + len(self._next) + len(self._history)
+
+    def _kick(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+        if len(self) >= self.max_batch and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self.flush())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.warning("db write-behind flush failed: %s", e)
+
+    def price(self, track_id: int, price_cents: Optional[int],
+              next_check_at: Optional[int] = None, interval_s: Optional[int] = None):
+        self._prices[track_id] = (price_cents, next_check_at, interval_s)
+        self._next.pop(track_id, None)
+        self._kick()
+
+    def reschedule(self, track_id: int, next_check_at: int):
+        self._next[track_id] = next_check_at
+        self._kick()
+
+    def history(self, track_key: str, ts: int, price_cents: int):
+        self._history[(track_key, ts)] = price_cents
+        self._kick()
+
+    def notified(self, track_id: int, price_cents: int):
+        self._notified[track_id] = price_cents
+        self._kick()
+
+    async def flush(self):
+        async with self._lock:
+            if not len(self):
+                return
+            prices, self._prices = self._prices, {}
+            notified, self._notified = self._notified, {}
+            nexts, self._next = self._next, {}
+            history, self._history = self._history, {}
+            try:
+                async with transaction() as db:
+                    await self._write(db, prices, notified, nexts, history)
+            except Exception:
+                # вернём несохранённое, не затирая более свежие значения
+                for tid, p in prices.items():
+                    self._prices.setdefault(tid, p)
+                for tid, p in notified.items():
+                    self._notified.setdefault(tid, p)
+                for tid, n in nexts.items():
+                    self._next.setdefault(tid, n)
+                for k, p in history.items():
+                    self._history.setdefault(k, p)
+                raise
+            log.debug("db flush: %d prices, %d notified", len(prices), len(notified))
+
+    @staticmethod
+    async def _write(db, prices, notified, nexts, history):
+        if prices:
+            await db.executemany(
+                "UPDATE tracks SET last_price_cents=?, last_checked_at=CURRENT_TIMESTAMP, "
+                "next_check_at=COALESCE(?, next_check_at), check_interval_s=COALESCE(?, check_interval_s) "
+                "WHERE id=?",
+                [(p, nxt, iv, tid) for tid, (p, nxt, iv) in prices.items()],
+            )
+        if notified:
+            await db.executemany(
+                "UPDATE tracks SET last_notified_price_cents=? WHERE id=?",
+                [(p, tid) for tid, p in notified.items()],
+            )
+        if nexts:
+            await db.executemany(
+                "UPDATE tracks SET next_check_at=? WHERE id=?",
+                [(n, tid) for tid, n in nexts.items()],
+            )
+        if history:
+            await db.executemany(
+                "INSERT OR IGNORE INTO price_history(track_key, ts, price_cents) VALUES (?, ?, ?)",
+                [(k, ts, p) for (k, ts), p in history.items()],
+            )
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+_DB: Optional[aiosqlite.Connection] = None
+_DB_LOCK = asyncio.Lock()
+# все записи идут через transaction(): одна транзакция на соединении в каждый момент
+_WRITE_LOCK = asyncio.Lock()
+WRITER = _Writer(max_batch=settings.db_batch_size, interval=settings.db_flush_interval_s)
+
+async def get_db() -> aiosqlite.Connection:
+    """
+    Одно долгоживущее соединение на процесс. SQL-строки здесь константные,
+    так что sqlite3 переиспользует подготовленные выражения из своего кэша.
+    """
+    global _DB
+    if _DB is not None:
+        return _DB
+    async with _DB_LOCK:
+        if _DB is None:
+            os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+            db = await aiosqlite.connect(DB_PATH)
+            db.row_factory = aiosqlite.Row
+            await db.executescript(CREATE_SQL)
+            await _migrate(db)
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.commit()
+            _DB = db
+    return _DB
+
+@contextlib.asynccontextmanager
+async def transaction():
+    """
+    Единица записи на общем соединении: BEGIN … COMMIT под одним локом, при ошибке — ROLLBACK.
+    Без лока чужой commit() фиксировал бы половину пачки, а наш rollback — чужие INSERT-ы.
+    """
+    db = await get_db()
+    async with _WRITE_LOCK:
+        await db.execute("BEGIN")
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
         await db.commit()
 
+async def close_db():
+    global _DB
+    if _DB is None:
+        return
+    try:
+        await WRITER.close()
+    finally:
+        await _DB.close()
+        _DB = None
+
+async def flush_writes():
+    await WRITER.flush()
+
+async def init_db():
+    await get_db()
+
 async def add_user(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         await db.execute("INSERT OR IGNORE INTO users(user_id) VALUES (?)", (user_id,))
-        await db.commit()
 
 async def add_track(user_id: int, title: str, url: str | None, mode: str, currency: str,
                     target_price_cents: int, steam_appid: int | None) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         cur = await db.execute(
             "INSERT INTO tracks(user_id, title, url, mode, currency, target_price_cents, steam_appid) "
             "VALUES (?, ?, ?, ?, ?, ?, ?)",
             (user_id, title, url, mode, currency, target_price_cents, steam_appid),
         )
-        await db.commit()
-        return cur.lastrowid
+    return cur.lastrowid
 
 async def list_tracks(user_id: int) -> list[Track]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT * FROM tracks WHERE user_id=? ORDER BY id", (user_id,)
-        )
-        rows = await cur.fetchall()
-        return [Track(**dict(r)) for r in rows]
+    await WRITER.flush()
+    db = await get_db()
+    cur = await db.execute(
+        "SELECT * FROM tracks WHERE user_id=? ORDER BY id", (user_id,)
+    )
+    rows = await cur.fetchall()
+    return [Track(**_track_fields(r)) for r in rows]
 
-async def get_all_tracks() -> list[Track]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM tracks ORDER BY id")
+# только то, что нужно планировщику цен
+SCHEDULER_COLUMNS = ("id", "user_id", "title", "url", "mode", "currency",
+                     "target_price_cents", "steam_appid", "last_price_cents",
+                     "last_notified_price_cents", "next_check_at", "check_interval_s")
+
+async def iter_due_tracks(now: int, batch_size: int = 500,
+                          columns: tuple = SCHEDULER_COLUMNS) -> AsyncIterator[list[Track]]:
+    """
+    Треки, у которых next_check_at <= now, в порядке срочности (индекс idx_tracks_next_check).
+    Курсор (next_check_at, id) гарантирует продвижение, даже пока записи ещё не сброшены.
+    """
+    db = await get_db()
+    sql = (f"SELECT {', '.join(columns)} FROM tracks "
+           "WHERE next_check_at <= ? AND (next_check_at, id) > (?, ?) "
+           "ORDER BY next_check_at, id LIMIT ?")
+    cursor = (-1, 0)
+    while True:
+        cur = await db.execute(sql, (now, *cursor, batch_size))
         rows = await cur.fetchall()
-        return [Track(**dict(r)) for r in rows]
+        if not rows:
+            return
+        yield [Track(**_track_fields(r)) for r in rows]
+        if len(rows) < batch_size:
+            return
+        cursor = (rows[-1]["next_check_at"], rows[-1]["id"])
 
-async def update_track_price(track_id: int, price_cents: int | None):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE tracks SET last_price_cents=?, last_checked_at=CURRENT_TIMESTAMP WHERE id=?",
-                         (price_cents, track_id))
-        await db.commit()
+async def next_due_at() -> Optional[int]:
+    db = await get_db()
+    cur = await db.execute("SELECT MIN(next_check_at) FROM tracks")
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+async def update_track_price(track_id: int, price_cents: int | None,
+                             next_check_at: int | None = None, interval_s: int | None = None):
+    WRITER.price(track_id, price_cents, next_check_at, interval_s)
+
+async def reschedule_track(track_id: int, next_check_at: int):
+    WRITER.reschedule(track_id, next_check_at)
 
 async def mark_notified(track_id: int, price_cents: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE tracks SET last_notified_price_cents=? WHERE id=?", (price_cents, track_id))
-        await db.commit()
+    WRITER.notified(track_id, price_cents)
 
 async def remove_track(user_id: int, track_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with transaction() as db:
         cur = await db.execute("DELETE FROM tracks WHERE id=? AND user_id=?", (track_id, user_id))
-        await db.commit()
-        return cur.rowcount > 0
+    return cur.rowcount > 0
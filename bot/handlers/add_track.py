@@ -6,7 +6,6 @@ from ..states import AddTrack
 from ..keyboards import currency_kb, mode_kb
 from ..utils import try_extract_steam_appid, to_cents, fmt_price
 from ..db import add_track
-from ..price_providers.steam import get_price_by_appid
 
 router = Router()
 
@@ -23,6 +22,7 @@ async def got_item(m: types.Message, state: FSMContext):
     ctx = {"title": None, "url": None, "steam_appid": None}
     if appid:
         # try fetch name to show friendly confirmation
+        from ..price_providers.steam import get_price_by_appid
         price, currency, name = await get_price_by_appid(appid, cc="ru", lang="russian")
         ctx["title"] = name or f"Steam app {appid}"
         ctx["url"] = text
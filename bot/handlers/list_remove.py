@@ -2,6 +2,8 @@
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from ..db import list_tracks, remove_track
+from ..history import price_stats
+from ..models import track_key
 from ..keyboards import remove_kb
 from ..utils import fmt_price
 
@@ -15,7 +17,12 @@ async def list_cmd(m: types.Message):
         return
     lines = ["Ваши отслеживания:"]
     for t in tracks:
-        lines.append(f"#{t.id} • {t.title} — цель {fmt_price(t.target_price_cents, t.currency)} — последняя цена: {fmt_price(t.last_price_cents, t.currency if t.mode=='steam' else 'USD')}")
+        cur = t.currency if t.mode=='steam' else 'USD'
+        line = f"#{t.id} • {t.title} — цель {fmt_price(t.target_price_cents, t.currency)} — последняя цена: {fmt_price(t.last_price_cents, cur)}"
+        stats = await price_stats(track_key(t), 30)
+        if stats.min_cents is not None:
+            line += f" (мин. за 30 дн.: {fmt_price(stats.min_cents, cur)})"
+        lines.append(line)
     await m.answer("\n".join(lines))
 
     # bonus: кнопки удаления (по одному сообщению на позицию, чтобы не перегружать)
@@ -0,0 +1,117 @@
+
+import logging, time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from .config import settings
+from .db import WRITER, get_db, transaction
+
+log = logging.getLogger("bot.history")
+
+DAY = 86400
+
+class PriceStats(NamedTuple):
+    min_cents: Optional[int]
+    max_cents: Optional[int]
+    last_cents: Optional[int]
+    points: int
+
+# последняя записанная цена по ключу — чтобы не ходить в БД за каждой проверкой
+_LAST: "OrderedDict[str, int]" = OrderedDict()
+_LAST_MAX = 10000
+
+async def _last_price(track_key: str) -> Optional[int]:
+    if track_key in _LAST:
+        _LAST.move_to_end(track_key)
+        return _LAST[track_key]
+    db = await get_db()
+    cur = await db.execute(
+        "SELECT price_cents FROM price_history WHERE track_key=? ORDER BY ts DESC LIMIT 1", (track_key,)
+    )
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+def _remember(track_key: str, price_cents: int):
+    _LAST[track_key] = price_cents
+    _LAST.move_to_end(track_key)
+    while len(_LAST) > _LAST_MAX:
+        _LAST.popitem(last=False)
+
+async def record_price(track_key: str, price_cents: Optional[int], ts: Optional[int] = None):
+    """Пишет точку истории только если цена изменилась (run-length)."""
+    if price_cents is None:
+        return
+    if await _last_price(track_key) == price_cents:
+        return
+    _remember(track_key, price_cents)
+    WRITER.history(track_key, int(ts if ts is not None else time.time()), price_cents)
+
+async def price_stats(track_key: str, days: int) -> PriceStats:
+    """
+    min/max/последняя цена за days дней. Точка до начала окна тоже учитывается:
+    при run-length хранении именно она задаёт цену на начало периода.
+    """
+    since = int(time.time()) - days * DAY
+    db = await get_db()
+    cur = await db.execute(
+        "SELECT MIN(price_cents), MAX(price_cents), COUNT(*) FROM price_history WHERE track_key=? AND ts>=?",
+        (track_key, since),
+    )
+    mn, mx, cnt = await cur.fetchone()
+    cur = await db.execute(
+        "SELECT price_cents FROM price_history WHERE track_key=? AND ts<? ORDER BY ts DESC LIMIT 1",
+        (track_key, since),
+    )
+    row = await cur.fetchone()
+    if row:
+        mn = row[0] if mn is None else min(mn, row[0])
+        mx = row[0] if mx is None else max(mx, row[0])
+    cur = await db.execute(
+        "SELECT price_cents FROM price_history WHERE track_key=? ORDER BY ts DESC LIMIT 1", (track_key,)
+    )
+    last = await cur.fetchone()
+    return PriceStats(mn, mx, last[0] if last else None, cnt)
+
+async def price_points(track_key: str, days: int) -> list[tuple[int, int]]:
+    """Точки (ts, price_cents) за последние days дней по возрастанию времени."""
+    since = int(time.time()) - days * DAY
+    db = await get_db()
+    cur = await db.execute(
+        "SELECT ts, price_cents FROM price_history WHERE track_key=? AND ts>=? ORDER BY ts",
+        (track_key, since),
+    )
+    return [(r[0], r[1]) for r in await cur.fetchall()]
+
+DOWNSAMPLE_SQL = '''
+DELETE FROM price_history
+WHERE ts < :cut AND (track_key, ts) NOT IN (
+  SELECT track_key, ts FROM (
+    SELECT track_key, ts,
+      ROW_NUMBER() OVER (PARTITION BY track_key, ts / 86400 ORDER BY price_cents, ts) AS rmin,
+      ROW_NUMBER() OVER (PARTITION BY track_key, ts / 86400 ORDER BY price_cents DESC, ts) AS rmax,
+      ROW_NUMBER() OVER (PARTITION BY track_key, ts / 86400 ORDER BY ts DESC) AS rlast
+    FROM price_history WHERE ts < :cut
+  ) WHERE rmin = 1 OR rmax = 1 OR rlast = 1
+)
+'''
+
+RETENTION_SQL = '''
+DELETE FROM price_history
+WHERE ts < :cut AND ts < (
+  SELECT MAX(p.ts) FROM price_history p WHERE p.track_key = price_history.track_key
+)
+'''
+
+async def maintain_history():
+    """
+    Обслуживание истории:
+      - старше history_downsample_days — по дню остаются только min, max и последняя точка;
+      - старше history_retention_days — удаляется (кроме последней точки ключа).
+    """
+    await WRITER.flush()
+    now = int(time.time())
+    async with transaction() as db:
+        cur = await db.execute(DOWNSAMPLE_SQL, {"cut": now - settings.history_downsample_days * DAY})
+        thinned = cur.rowcount
+        cur = await db.execute(RETENTION_SQL, {"cut": now - settings.history_retention_days * DAY})
+        dropped = cur.rowcount
+    log.info("price history maintenance: %d thinned, %d dropped", thinned, dropped)
@@ -1,30 +1,44 @@
 # bot/main.py
 from __future__ import annotations
-import logging, re
+import logging, re, sys
+from typing import TYPE_CHECKING
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
     Message, FSInputFile, InputMediaPhoto,
     InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 )
-from .config import settings
-from .utils.logging import setup_logging
-from .parsers.ozon import parse_ozon
-from .parsers.wb import parse_wb
-from .media.downloader import download_many_async
+from . import config
 from .post.template import make_post
 from .state.cache import STORE
 
-setup_logging()
+# Парсеры, Playwright, httpx, aiosqlite и провайдеры цен грузятся при первом использовании
+# (или в фоне из warm-up), чтобы бот начинал polling как можно раньше.
+if TYPE_CHECKING:
+    from .media.downloader import MediaRef
+
 log = logging.getLogger("bot.main")
 
 URL_RE = re.compile(r"https?://\S+", re.I)
-def is_ozon(u): return "ozon.ru" in u
-def is_wb(u): return "wildberries.ru" in u or "wb.ru" in u
+
+async def _send_photos(m: Message, refs: list[MediaRef], caption: str):
+    media = []
+    for i, r in enumerate(refs[:4]):
+        src = r.file_id or FSInputFile(r.path)
+        if i == 0:
+            media.append(InputMediaPhoto(media=src, caption=caption, parse_mode=ParseMode.HTML))
+        else:
+            media.append(InputMediaPhoto(media=src))
+    return await m.answer_media_group(media=media)
 
 async def handle_url(url: str, m: Message):
-    data = parse_ozon(url) if is_ozon(url) else parse_wb(url) if is_wb(url) else None
+    from .media.cache import MEDIA
+    from .media.downloader import prepare_media_async
+    from .parsers.service import parse_product, is_ozon, is_wb
+
+    data = await parse_product(url)
     if not data:
         await m.answer("Кинь ссылку на Ozon или Wildberries 😉"); return
 
@@ -45,14 +59,26 @@ async def handle_url(url: str, m: Message):
         source=source or ("ozon" if is_ozon(url) else "wb" if is_wb(url) else "")
     )
 
-    files = await download_many_async(imgs, out_dir="downloads", prefix="media", limit=4, concurrency=4, referer=url)
+    refs = await prepare_media_async(imgs, limit=4, concurrency=4, referer=url)
 
     sent_msgs = []
-    if files:
-        media = [InputMediaPhoto(media=FSInputFile(files[0]), caption=caption, parse_mode=ParseMode.HTML)]
-        for p in files[1:4]:
-            media.append(InputMediaPhoto(media=FSInputFile(p)))
-        sent_msgs = await m.answer_media_group(media=media)
+    if refs:
+        try:
+            sent_msgs = await _send_photos(m, refs, caption)
+        except TelegramBadRequest as e:
+            if not any(r.file_id for r in refs):
+                raise
+            # file_id мог протухнуть — забываем и шлём файлами
+            log.info("cached file_id rejected (%s), re-uploading", e)
+            for r in refs:
+                if r.file_id:
+                    await MEDIA.forget_file_id(r.url)
+            refs = await prepare_media_async(imgs, limit=4, concurrency=4, referer=url, use_file_ids=False)
+            sent_msgs = await _send_photos(m, refs, caption) if refs else [await m.answer(caption, parse_mode=ParseMode.HTML)]
+        # запомним file_id, чтобы в следующий раз не качать и не загружать заново
+        for r, msg in zip(refs, sent_msgs):
+            if msg.photo and not r.file_id:
+                await MEDIA.remember_file_id(r.url, msg.photo[-1].file_id)
     else:
         sent_msgs = [await m.answer(caption, parse_mode=ParseMode.HTML)]
 
@@ -83,7 +109,7 @@ async def on_publish(call: CallbackQuery):
     if not data:
         await call.answer("Данные не найдены или устарели", show_alert=True); return
 
-    channel = (settings.channel_username or "").strip()
+    channel = (config.settings.channel_username or "").strip()
     if not channel:
         await call.answer("Укажи CHANNEL_USERNAME в .env", show_alert=True); return
 
@@ -107,12 +133,33 @@ async def on_publish(call: CallbackQuery):
 
     await call.answer("Опубликовано ✅", show_alert=False)
 
+async def _on_startup():
+    from .warmup import on_startup
+    await on_startup()
+
+async def _on_shutdown():
+    # закрываем только то, что успело загрузиться
+    if "bot.utils.pwhelper" in sys.modules:
+        await sys.modules["bot.utils.pwhelper"].close_pool()
+    if "bot.utils.http" in sys.modules:
+        await sys.modules["bot.utils.http"].HTTP.aclose()
+    if "bot.media.cache" in sys.modules:
+        await sys.modules["bot.media.cache"].MEDIA.close()
+    if "bot.state.product_cache" in sys.modules:
+        await sys.modules["bot.state.product_cache"].PRODUCT_CACHE.close()
+    if "bot.db" in sys.modules:
+        await sys.modules["bot.db"].close_db()
+
 def main():
+    config.bootstrap()
+    settings = config.settings
     log.info("Bot is running… SHOW_BROWSER=%s", settings.show_browser)
     bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
     dp = Dispatcher()
     dp.message.register(on_message, F.text.regexp(URL_RE.pattern))
     dp.callback_query.register(on_publish, F.data.startswith("pub:"))
+    dp.startup.register(_on_startup)
+    dp.shutdown.register(_on_shutdown)
     dp.run_polling(bot)
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+# bot/media/cache.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import aiosqlite
+
+from ..config import settings
+
+log = logging.getLogger(__name__)
+
+CREATE_SQL = '''
+CREATE TABLE IF NOT EXISTS media_blobs (
+  sha TEXT PRIMARY KEY,
+  path TEXT,
+  size INTEGER NOT NULL DEFAULT 0,
+  last_used REAL NOT NULL,
+  file_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_media_blobs_used ON media_blobs(last_used);
+CREATE TABLE IF NOT EXISTS media_urls (
+  url TEXT PRIMARY KEY,
+  sha TEXT NOT NULL
+);
+'''
+
+# Недавно отданные/записанные файлы не вытесняем: их путь мог только что уйти
+# в handle_url, и FSInputFile упал бы на удалённом файле.
+EVICT_GRACE_S = 300
+
+
+class MediaCache:
+    """
+    Контент-адресуемый кэш картинок: файл лежит под sha256 содержимого,
+    URL -> sha -> (путь, file_id Telegram). Размер ограничен max_bytes, вытеснение по LRU.
+    После вытеснения файла file_id остаётся — его хватает для повторной отправки.
+    Соединение с sqlite одно на всё время работы; записи идут под _write_lock.
+    """
+
+    def __init__(self, root: str, db_path: str, max_bytes: int):
+        self.root = root
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._conn_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+
+    async def _db(self) -> aiosqlite.Connection:
+        if self._conn is not None:
+            return self._conn
+        async with self._conn_lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                db = await aiosqlite.connect(self.db_path)
+                await db.executescript(CREATE_SQL)
+                await db.commit()
+                self._conn = db
+        return self._conn
+
+    async def warm(self):
+        await self._db()
+
+    async def close(self):
+        if self._conn is not None:
+            db, self._conn = self._conn, None
+            await db.close()
+
+    def path_for(self, sha: str, ext: str) -> str:
+        return os.path.join(self.root, sha[:2], f"{sha}{ext}")
+
+    async def lookup_many(self, urls: Iterable[str]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """url -> (file_id, path) одним запросом; неизвестных URL в ответе нет, path может быть None."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        db = await self._db()
+        cur = await db.execute(
+            "SELECT u.url, b.sha, b.file_id, b.path FROM media_urls u JOIN media_blobs b ON b.sha=u.sha "
+            f"WHERE u.url IN ({','.join('?' * len(urls))})",
+            urls,
+        )
+        rows = await cur.fetchall()
+        if not rows:
+            return {}
+        found = {}
+        for url, _sha, file_id, path in rows:
+            if path and not os.path.exists(path):
+                path = None
+            found[url] = (file_id, path)
+        shas = list({r[1] for r in rows})
+        async with self._write_lock:
+            await db.execute(
+                f"UPDATE media_blobs SET last_used=? WHERE sha IN ({','.join('?' * len(shas))})",
+                [time.time(), *shas],
+            )
+            await db.commit()
+        return found
+
+    async def lookup(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        """(file_id, path) для URL; любой из элементов может быть None."""
+        return (await self.lookup_many([url])).get(url, (None, None))
+
+    def tmp_dir(self) -> str:
+        d = os.path.join(self.root, "tmp")
+        os.makedirs(d, exist_ok=True)
+        return d
+
+    async def adopt(self, url: str, tmp_path: str, sha: str, size: int, ext: str) -> str:
+        """Забирает уже скачанный временный файл в кэш (атомарный rename в путь по sha)."""
+        path = self.path_for(sha, ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        await self._register(url, sha, path, size)
+        return path
+
+    async def _register(self, url: str, sha: str, path: str, size: int):
+        db = await self._db()
+        async with self._write_lock:
+            await db.execute(
+                "INSERT INTO media_blobs(sha, path, size, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(sha) DO UPDATE SET path=excluded.path, size=excluded.size, last_used=excluded.last_used",
+                (sha, path, size, time.time()),
+            )
+            await db.execute("INSERT OR REPLACE INTO media_urls(url, sha) VALUES (?, ?)", (url, sha))
+            await db.commit()
+            await self._evict(db)
+
+    async def _evict(self, db: aiosqlite.Connection):
+        cur = await db.execute("SELECT COALESCE(SUM(size), 0) FROM media_blobs WHERE path IS NOT NULL")
+        total = (await cur.fetchone())[0]
+        if total <= self.max_bytes:
+            return
+        cur = await db.execute(
+            "SELECT sha, path, size FROM media_blobs WHERE path IS NOT NULL AND last_used < ? ORDER BY last_used",
+            (time.time() - EVICT_GRACE_S,),
+        )
+        evicted = 0
+        for sha, path, size in await cur.fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log.debug("media evict failed %s: %s", path, e)
+                continue
+            await db.execute("UPDATE media_blobs SET path=NULL, size=0 WHERE sha=?", (sha,))
+            total -= size
+            evicted += 1
+        await db.commit()
+        log.info("media cache: evicted %d files, now %d bytes", evicted, total)
+
+    async def remember_file_id(self, url: str, file_id: str):
+        db = await self._db()
+        async with self._write_lock:
+            await db.execute(
+                "UPDATE media_blobs SET file_id=? WHERE sha=(SELECT sha FROM media_urls WHERE url=?)",
+                (file_id, url),
+            )
+            await db.commit()
+
+    async def forget_file_id(self, url: str):
+        db = await self._db()
+        async with self._write_lock:
+            await db.execute(
+                "UPDATE media_blobs SET file_id=NULL WHERE sha=(SELECT sha FROM media_urls WHERE url=?)",
+                (url,),
+            )
+            await db.commit()
+
+
+MEDIA = MediaCache(
+    settings.media_cache_dir,
+    settings.media_cache_db,
+    settings.media_cache_max_mb * 1024 * 1024,
+)
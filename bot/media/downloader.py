@@ -4,13 +4,17 @@ from __future__ import annotations
 import asyncio
 import hashlib
 import logging
-import mimetypes
 import os
-import pathlib
+import tempfile
+from dataclasses import dataclass
 from typing import Iterable, List, Optional
 
 import httpx
 
+from ..config import settings
+from ..utils.http import http_client
+from .cache import MEDIA
+
 log = logging.getLogger(__name__)
 
 UA = (
@@ -19,29 +23,78 @@ UA = (
     "Chrome/124.0.0.0 Safari/537.36"
 )
 
-def _ext_from_response(url: str, content_type: Optional[str]) -> str:
-    if content_type:
-        ct = content_type.split(";", 1)[0].strip().lower()
-        ext = mimetypes.guess_extension(ct)
-        if ext:
-            return ext
-    for e in (".jpg", ".jpeg", ".png", ".webp", ".gif"):
-        if url.lower().endswith(e):
-            return e
-    return ".jpg"
+def _sniff_image(head: bytes) -> Optional[str]:
+    """Расширение по сигнатуре первых байт; None — это не картинка."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis", b"heic", b"heix", b"mif1"):
+        return ".avif"
+    return None
 
-async def download_many_async(
-    urls: Iterable[str],
-    out_dir: str = "downloads",
-    prefix: str = "media",
-    limit: int = 10,
-    concurrency: int = 4,
-    referer: Optional[str] = None,
-) -> List[str]:
-    """Асинхронная загрузка изображений с сохранением исходного порядка."""
+SNIFF_BYTES = 12
+
+class _Rejected(Exception):
+    pass
+
+async def _stream_to_temp(c: httpx.AsyncClient, url: str, headers: dict, tmp_dir: str, max_bytes: int):
+    """
+    Качает картинку потоком во временный файл: (tmp_path, sha256, size, ext).
+    Прерывает загрузку при превышении max_bytes или если первые байты — не картинка.
+    """
+    async with c.stream("GET", url, headers=headers) as r:
+        if r.status_code != 200:
+            raise _Rejected(f"HTTP {r.status_code}")
+        declared = r.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise _Rejected(f"content-length {declared} > {max_bytes}")
+
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        h = hashlib.sha256()
+        size = 0
+        head = b""
+        ext = None
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in r.aiter_bytes(settings.media_chunk_bytes):
+                    if ext is None and len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                        if len(head) >= SNIFF_BYTES:
+                            ext = _sniff_image(head)
+                            if ext is None:
+                                raise _Rejected("not an image")
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise _Rejected(f"body > {max_bytes}")
+                    h.update(chunk)
+                    f.write(chunk)
+            if ext is None:
+                ext = _sniff_image(head)
+                if ext is None:
+                    raise _Rejected("not an image")
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return tmp, h.hexdigest(), size, ext
+
+@dataclass
+class MediaRef:
+    """Картинка для отправки: file_id Telegram (без загрузки) или локальный файл из кэша."""
+    url: str
+    file_id: Optional[str] = None
+    path: Optional[str] = None
+
+
+def _dedup(urls: Iterable[str], limit: int) -> List[str]:
     urls = [u for u in (urls or []) if isinstance(u, str) and u.strip()]
-    if not urls:
-        return []
     # дедуп + ограничение, но порядок сохраняем
     seen = set(); ordered = []
     for u in urls:
@@ -49,8 +102,10 @@ async def download_many_async(
             seen.add(u); ordered.append(u)
         if len(ordered) >= limit:
             break
+    return ordered
 
-    pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+async def _download_into_cache(urls: List[str], concurrency: int, referer: Optional[str]) -> List[Optional[str]]:
     headers = {
         "User-Agent": UA,
         "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
@@ -59,33 +114,68 @@ async def download_many_async(
     if referer:
         headers["Referer"] = referer
 
-    results: List[Optional[str]] = [None] * len(ordered)
+    results: List[Optional[str]] = [None] * len(urls)
     sem = asyncio.Semaphore(concurrency)
 
-    async with httpx.AsyncClient(timeout=25, follow_redirects=True, headers=headers) as c:
-        async def fetch(idx: int, url: str):
-            async with sem:
-                try:
-                    r = await c.get(url)
-                    if r.status_code != 200:
-                        return
-                    ct = r.headers.get("content-type", "").lower()
-                    if "image" not in ct and not any(url.lower().endswith(e) for e in (".jpg",".jpeg",".png",".webp",".gif")):
-                        return
-                    ext = _ext_from_response(url, ct)
-                    h = hashlib.md5(url.encode("utf-8")).hexdigest()[:8]
-                    path = os.path.join(out_dir, f"{prefix}_{idx+1:02d}_{h}{ext}")
-                    with open(path, "wb") as f:
-                        f.write(r.content)
-                    results[idx] = path
-                except Exception as e:
-                    log.debug("download fail %s: %s", url, e)
-
-        await asyncio.gather(*(fetch(i, u) for i, u in enumerate(ordered)))
-
-    return [p for p in results if p]
-
-def download_many(urls: Iterable[str], out_dir="downloads", prefix="media") -> List[str]:
-    return asyncio.get_event_loop().run_until_complete(
-        download_many_async(urls, out_dir=out_dir, prefix=prefix)
-    )
+    tmp_dir = MEDIA.tmp_dir()
+
+    c = http_client("media")
+
+    async def fetch(idx: int, url: str):
+        async with sem:
+            try:
+                tmp, sha, size, ext = await _stream_to_temp(c, url, headers, tmp_dir, settings.media_max_bytes)
+                results[idx] = await MEDIA.adopt(url, tmp, sha, size, ext)
+            except _Rejected as e:
+                log.info("download skipped %s: %s", url, e)
+            except Exception as e:
+                log.debug("download fail %s: %s", url, e)
+
+    await asyncio.gather(*(fetch(i, u) for i, u in enumerate(urls)))
+
+    return results
+
+
+async def prepare_media_async(
+    urls: Iterable[str],
+    limit: int = 10,
+    concurrency: int = 4,
+    referer: Optional[str] = None,
+    use_file_ids: bool = True,
+) -> List[MediaRef]:
+    """
+    Готовит картинки к отправке с сохранением порядка: сначала известный file_id,
+    затем файл из кэша, и только потом загрузка.
+    """
+    ordered = _dedup(urls, limit)
+    try:
+        known = await MEDIA.lookup_many(ordered)
+    except Exception as e:
+        log.debug("media cache lookup fail: %s", e)
+        known = {}
+    refs: List[MediaRef] = []
+    for u in ordered:
+        file_id, path = known.get(u, (None, None))
+        refs.append(MediaRef(u, file_id if use_file_ids else None, path))
+
+    missing = [i for i, r in enumerate(refs) if not r.file_id and not r.path]
+    if missing:
+        paths = await _download_into_cache([refs[i].url for i in missing], concurrency, referer)
+        for i, p in zip(missing, paths):
+            refs[i].path = p
+    return [r for r in refs if r.file_id or r.path]
+
+
+async def download_many_async(
+    urls: Iterable[str],
+    limit: int = 10,
+    concurrency: int = 4,
+    referer: Optional[str] = None,
+) -> List[str]:
+    """Асинхронная загрузка изображений (через кэш) с сохранением исходного порядка."""
+    refs = await prepare_media_async(urls, limit=limit, concurrency=concurrency,
+                                     referer=referer, use_file_ids=False)
+    return [r.path for r in refs if r.path]
+
+def download_many(urls: Iterable[str]) -> List[str]:
+    return asyncio.get_event_loop().run_until_complete(download_many_async(urls))
@@ -1,6 +1,6 @@
 
 from dataclasses import dataclass
-from typing import Optional, Literal
+from typing import Optional, Literal, Tuple
 
 Mode = Literal["steam", "any"]
 Currency = Literal["RUB", "USD"]
@@ -17,3 +17,17 @@ class Track:
     steam_appid: int | None = None
     last_price_cents: int | None = None
     last_notified_price_cents: int | None = None
+    next_check_at: int = 0
+    check_interval_s: int | None = None
+
+def norm_title(title: str) -> str:
+    return " ".join((title or "").casefold().split())
+
+def lookup_key(t: Track) -> Tuple[str, str]:
+    """Ключ цены игры: одинаковые игры у разных пользователей запрашиваются и хранятся один раз."""
+    if t.mode == "steam" and t.steam_appid:
+        return ("steam", str(t.steam_appid))
+    return ("title", norm_title(t.title))
+
+def track_key(t: Track) -> str:
+    return "%s:%s" % lookup_key(t)
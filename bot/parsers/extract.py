@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import html as html_lib
+import logging
+import re
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+log = logging.getLogger("bot.parsers.extract")
+
+BASKET_IMG_RE = re.compile(
+    r"https://basket-\d{2}\.wbbasket\.ru/vol\d+/(?:part\d+/)?\d+/images/(?:big|c516x688|c246x328)/\d+\.(?:webp|jpg)"
+)
+# Без re.I: регистронезависимый поиск по кириллице в мегабайтном HTML в ~6 раз медленнее,
+# поэтому встречающиеся варианты написания перечислены явно.
+NM_HINT_RE = re.compile(
+    r"(?:Артикул|артикул|АРТИКУЛ|nmId|nmID|nm_id|productId|productID|product_id)[^\d]{0,16}(\d{6,12})"
+)
+
+# Только то, что нужно парсерам; каждый шаблон привязан к короткому литералу,
+# поэтому поиск идёт на C-скорости без откатов по всему документу.
+_LD_RE = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.I | re.S)
+_STATE_SCRIPT_RE = re.compile(r'<script[^>]*\bid=["\'](state-[^"\']*|__INITIAL_STATE__)["\'][^>]*>(.*?)</script>', re.I | re.S)
+_META_RE = re.compile(r"<meta\b[^>]*>", re.I)
+_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.I | re.S)
+_ID_RE = re.compile(r'\bid=["\']([^"\']*)["\']')
+
+
+@dataclass
+class PageExtract:
+    """Всё, что парсерам нужно со страницы: из выжимки в браузере или из HTML (extract_html)."""
+    ld_json: List[str] = field(default_factory=list)
+    # name/property/itemprop (в нижнем регистре) -> content первого такого meta
+    meta: Dict[str, str] = field(default_factory=dict)
+    og_images: List[str] = field(default_factory=list)
+    # id элемента (state-webPrice-..., state-card-app, ...) -> data-state или текст script
+    states: Dict[str, str] = field(default_factory=dict)
+    title: Optional[str] = None
+    basket_images: List[str] = field(default_factory=list)
+    nm_hint: Optional[str] = None
+
+    def state(self, prefix: str) -> Optional[str]:
+        for k, v in self.states.items():
+            if k.startswith(prefix):
+                return v
+        return None
+
+
+def _attrs(tag: str) -> Dict[str, str]:
+    return {m.group(1).lower(): html_lib.unescape(m.group(2) if m.group(2) is not None else m.group(3))
+            for m in _ATTR_RE.finditer(tag)}
+
+
+def _data_states(html: str, out: Dict[str, str]):
+    # data-state="..." — кавычки внутри JSON экранированы (&quot;), значит значение до следующей "
+    pos = 0
+    while True:
+        i = html.find('data-state="', pos)
+        if i < 0:
+            return
+        j = html.find('"', i + 12)
+        if j < 0:
+            return
+        tag_start = html.rfind("<", 0, i)
+        m = _ID_RE.search(html, tag_start, i) if tag_start >= 0 else None
+        key = (m.group(1) if m else "") or "data-state"
+        if key not in out and j > i + 12:
+            out[key] = html_lib.unescape(html[i + 12:j])
+        pos = j + 1
+
+
+def extract_html(html: str) -> PageExtract:
+    """
+    Выжимка из HTML без полного разбора DOM: несколько скомпилированных regex и str.find.
+    Синхронная и CPU-ёмкая на мегабайтных страницах — из event loop звать через page_extract().
+    """
+    out = PageExtract()
+    if not html:
+        return out
+    out.ld_json = [m.group(1) for m in _LD_RE.finditer(html)]
+    for m in _META_RE.finditer(html):
+        a = _attrs(m.group(0))
+        key = (a.get("property") or a.get("name") or a.get("itemprop") or "").lower()
+        if key and "content" in a:
+            if key == "og:image":
+                out.og_images.append(a["content"])
+            out.meta.setdefault(key, a["content"])
+    _data_states(html, out.states)
+    for m in _STATE_SCRIPT_RE.finditer(html):
+        out.states.setdefault(m.group(1), m.group(2))
+    m = _TITLE_RE.search(html)
+    if m:
+        out.title = html_lib.unescape(m.group(1)).strip() or None
+    if "wbbasket" in html:
+        out.basket_images = list(dict.fromkeys(BASKET_IMG_RE.findall(html)))
+    m = NM_HINT_RE.search(html)
+    if m:
+        out.nm_hint = m.group(1)
+    return out
+
+
+async def page_extract(res: Dict[str, Any]) -> PageExtract:
+    """PageExtract из результата run_get_page_data_async: выжимка из браузера или разбор HTML в потоке."""
+    payload = res.get("extract")
+    if isinstance(payload, dict):
+        kw = {f.name: payload[f.name] for f in fields(PageExtract) if payload.get(f.name) is not None}
+        return PageExtract(**kw)
+    html = res.get("html") or ""
+    if not html:
+        return PageExtract()
+    return await asyncio.to_thread(extract_html, html)
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-import re
+import time
 from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
 
 from ..config import settings
-from ..utils.logging import setup_logging
-from ..utils.pwhelper import run_get_page_data
+from ..utils.http import HTTP, http_client
+from ..utils.pwhelper import UA, close_pool, context_cookies, run_get_page_data_async
+from .extract import PageExtract, page_extract
 from .utils import parse_ld_list, first_product, product_fields, normalize_urls
 
-setup_logging()
 log = logging.getLogger("bot.parsers.ozon")
 
+OZON_ORIGIN = "https://www.ozon.ru"
+COMPOSER_PATH = "/api/composer-api.bx/page/json/v2"
+# после ответа антибота прямой путь выключается на ozon_direct_backoff_s
+_direct_off_until = 0.0
+
 
 def _digits(n: Any) -> Optional[int]:
     if n is None:
@@ -62,24 +69,14 @@ def _price_from_composer(comp: Dict[str, Any]) -> tuple[Optional[int], Optional[
     return card_price, regular_price
 
 
-def _price_from_html(html: str) -> tuple[Optional[int], Optional[int]]:
+def _price_from_state(page: PageExtract) -> tuple[Optional[int], Optional[int]]:
     """
-    Из статики: <div id="state-webPrice-... " data-state="...json...">
+    Из статики: <div id="state-webPrice-..." data-state="...json..."> (data-state уже раскодирован).
     """
-    if not html:
-        return None, None
-
-    m = re.search(
-        r'id="state-webPrice-[^"]+"\s+data-state="([^"]+)"',
-        html,
-    )
-    if not m:
+    raw = page.state("state-webPrice-")
+    if not raw:
         return None, None
-
     try:
-        # Внутри чаще всего обычный JSON (без экранирования), но на всякий случай заменим &quot;
-        raw = m.group(1)
-        raw = raw.replace("&quot;", '"')
         data = json.loads(raw)
     except Exception:
         return None, None
@@ -87,16 +84,91 @@ def _price_from_html(html: str) -> tuple[Optional[int], Optional[int]]:
     return _digits(data.get("cardPrice")), _digits(data.get("price"))
 
 
-def parse_ozon(url: str) -> Dict[str, Any]:
+def _has_price_widget(comp: Optional[Dict[str, Any]]) -> bool:
+    ws = (comp or {}).get("widgetStates")
+    return isinstance(ws, dict) and any(isinstance(k, str) and "webPrice-" in k for k in ws)
+
+
+def _page_from_seo(comp: Dict[str, Any]) -> PageExtract:
+    """LD+JSON, meta и title из блока seo ответа composer — то же, что отдала бы страница."""
+    seo = comp.get("seo") or {}
+    page = PageExtract(title=seo.get("title") or None)
+    for sc in seo.get("script") or []:
+        if isinstance(sc, dict) and sc.get("type") == "application/ld+json" and sc.get("innerHTML"):
+            page.ld_json.append(sc["innerHTML"])
+    for m in seo.get("meta") or []:
+        if not isinstance(m, dict):
+            continue
+        key = (m.get("property") or m.get("name") or "").lower()
+        content = m.get("content")
+        if key and content is not None:
+            if key == "og:image":
+                page.og_images.append(content)
+            page.meta.setdefault(key, content)
+    return page
+
+
+async def _composer_direct(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Composer товара одним HTTP-запросом с куками тёплого браузера.
+    None — кук ещё нет, антибот или в ответе нет цены: тогда идём через страницу.
+    """
+    global _direct_off_until
+    if not settings.ozon_direct or time.monotonic() < _direct_off_until:
+        return None
+    jar = await context_cookies(OZON_ORIGIN, "ozon")
+    if not jar:
+        return None
+
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    headers = {
+        "User-Agent": UA,
+        "Accept": "application/json",
+        "Referer": url,
+        "Cookie": "; ".join(f"{c['name']}={c['value']}" for c in jar),
+    }
+    try:
+        r = await http_client("ozon").get(OZON_ORIGIN + COMPOSER_PATH, params={"url": path}, headers=headers)
+    except Exception as e:
+        log.info("Ozon direct: request failed: %s", e)
+        return None
+
+    comp = None
+    if r.status_code == 200 and "json" in r.headers.get("content-type", ""):
+        try:
+            comp = r.json()
+        except Exception:
+            comp = None
+    if comp is None:
+        # 403/429, редирект на проверку или HTML-заглушка — куки протухли
+        _direct_off_until = time.monotonic() + settings.ozon_direct_backoff_s
+        log.info("Ozon direct: anti-bot response (HTTP %s), browser only for %.0fs",
+                 r.status_code, settings.ozon_direct_backoff_s)
+        return None
+    if not _has_price_widget(comp):
+        log.info("Ozon direct: no webPrice in composer for %s", url)
+        return None
+    return comp
+
+
+async def parse_ozon_async(url: str) -> Dict[str, Any]:
     """
     Возвращает:
       title, description, rating, reviews, price (цена с Ozon Картой, если доступна),
       images, videos
+    Сначала — прямой запрос composer (если браузер уже набрал куки), иначе рендер страницы.
     """
-    r = run_get_page_data(url, settings, site="ozon") or {}
-    html = r.get("html", "") or ""
-    comp = r.get("composer") or {}
+    comp = await _composer_direct(url)
+    if comp is not None:
+        log.info("Ozon direct: composer hit for %s", url)
+        return _product_from(_page_from_seo(comp), comp)
+
+    r = await run_get_page_data_async(url, settings, site="ozon") or {}
+    return _product_from(await page_extract(r), r.get("composer") or {})
 
+
+def _product_from(page: PageExtract, comp: Dict[str, Any]) -> Dict[str, Any]:
     title = description = rating = None
     reviews = None
     price: Optional[int] = None
@@ -104,7 +176,7 @@ def parse_ozon(url: str) -> Dict[str, Any]:
     videos: List[str] = []
 
     # 1) JSON-LD, если есть (часто закрывает title/desc/rating/reviews/images)
-    ld = parse_ld_list(html, r.get("ld_scripts") or [])
+    ld = parse_ld_list(page.ld_json)
     product = first_product(ld)
     if product:
         t, d, rat, rev, imgs = product_fields(product)
@@ -141,22 +213,18 @@ def parse_ozon(url: str) -> Dict[str, Any]:
     # 3) Цена — жёстко из webPrice (Composer → HTML)
     card_price, regular_price = _price_from_composer(comp)
     if card_price is None and regular_price is None:
-        card_price, regular_price = _price_from_html(html)
+        card_price, regular_price = _price_from_state(page)
 
     # Берём именно цену по карте, если она есть; иначе обычную
     price = card_price or regular_price or None
 
     # 4) Fallback на OG-картинку (редко нужно)
-    if not images:
-        og = re.search(r'<meta\s+property="og:image"\s+content="([^"]+)"', html)
-        if og:
-            images = [og.group(1)]
+    if not images and page.og_images:
+        images = [page.og_images[0]]
 
     # Минимальная нормализация title
     if not title:
-        m = re.search(r"<title>([^<]+)</title>", html)
-        if m:
-            title = m.group(1).strip()
+        title = page.title
 
     return {
         "title": title or "Товар",
@@ -167,3 +235,14 @@ def parse_ozon(url: str) -> Dict[str, Any]:
         "images": images,
         "videos": videos,
     }
+
+
+def parse_ozon(url: str) -> Dict[str, Any]:
+    """Синхронная обёртка над parse_ozon_async (для скриптов вроде debug_dump.py)."""
+    async def _once():
+        try:
+            return await parse_ozon_async(url)
+        finally:
+            await close_pool()
+            await HTTP.aclose()
+    return asyncio.run(_once())
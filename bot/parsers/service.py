@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import Any, Dict, Optional
+
+from ..state.product_cache import PRODUCT_CACHE
+from ..state.singleflight import SingleFlight
+from .ozon import parse_ozon_async
+from .wb import parse_wb_async, _nm_from
+
+log = logging.getLogger("bot.parsers.service")
+
+OZON_ID_RE = re.compile(r"/product/(?:[^/?#]*-)?(\d+)/?")
+
+# один парсинг на товар, сколько бы пользователей ни прислали ссылку одновременно
+FLIGHTS = SingleFlight()
+
+
+def is_ozon(u: str) -> bool:
+    return "ozon.ru" in u
+
+def is_wb(u: str) -> bool:
+    return "wildberries.ru" in u or "wb.ru" in u
+
+
+def product_key(url: str) -> Optional[str]:
+    """Нормализованный ключ товара: "ozon:<id>" / "wb:<nm>" (None — ключ из URL не извлечь)."""
+    if is_ozon(url):
+        m = OZON_ID_RE.search(url)
+        return f"ozon:{m.group(1)}" if m else None
+    if is_wb(url):
+        nm = _nm_from(url)
+        return f"wb:{nm}" if nm else None
+    return None
+
+
+async def parse_product(url: str) -> Optional[Dict[str, Any]]:
+    """Точка входа для бота: парсер маркетплейса + кэш по SKU."""
+    if is_ozon(url):
+        parse = parse_ozon_async
+    elif is_wb(url):
+        parse = parse_wb_async
+    else:
+        return None
+    key = product_key(url)
+    loader = lambda: FLIGHTS.do(key or url, lambda: parse(url))
+    if key is None:
+        return await loader()
+    return await PRODUCT_CACHE.get_or_load(key, loader)
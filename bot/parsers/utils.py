@@ -2,9 +2,15 @@
 import json, re
 from typing import Any, Dict, List, Optional, Tuple
 
-def parse_ld_list(html: str, scripts: List[str]) -> List[Dict[str, Any]]:
+def parse_ld_list(scripts: List[str]) -> List[Dict[str, Any]]:
+    """LD+JSON объекты из текстов script; одинаковые тексты (DOM и HTML) разбираются один раз."""
     result: List[Dict[str, Any]] = []
+    seen = set()
     for s in scripts or []:
+        s = (s or "").strip()
+        if not s or s in seen:
+            continue
+        seen.add(s)
         try:
             data = json.loads(s)
             if isinstance(data, list): result.extend([x for x in data if isinstance(x, dict)])
@@ -16,15 +22,6 @@ def parse_ld_list(html: str, scripts: List[str]) -> List[Dict[str, Any]]:
                     if isinstance(obj, dict): result.append(obj)
                 except Exception:
                     pass
-    if html:
-        for m in re.finditer(r'<script[^>]+type="application/ld\+json"[^>]*>([\s\S]*?)</script>', html, re.I):
-            raw = m.group(1) or ""
-            try:
-                data = json.loads(raw)
-                if isinstance(data, list): result.extend([x for x in data if isinstance(x, dict)])
-                elif isinstance(data, dict): result.append(data)
-            except Exception:
-                pass
     return result
 
 def first_product(ld: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
@@ -1,164 +1,146 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import re
 from typing import Any, Dict, List, Optional
 
-import httpx
-
 from ..config import settings
-from ..utils.logging import setup_logging
-from ..utils.pwhelper import run_get_page_data
+from ..utils.http import HTTP, http_client
+from ..utils.pwhelper import close_pool, run_get_page_data_async
+from .extract import PageExtract, page_extract
 from .utils import parse_ld_list, first_product, product_fields, normalize_urls
+from .wb_basket import RESOLVER
 
-setup_logging()
 log = logging.getLogger("bot.parsers.wb")
 
 DESTS = ["-1257786", "-239094", "-5617406", "123585148", "123582156", "-80302"]
 SPP = [0, 1, 30]
 
 
-def _nm_from(url: str, html: str) -> str:
+def _nm_from(url: str, page: Optional[PageExtract] = None) -> str:
     m = re.search(r"/catalog/(\d+)/", url)
     if m:
         return m.group(1)
-    m = re.search(r"(?:Артикул|nmId|nm_id|productId)[^\d]{0,16}(\d{6,12})", html or "", re.I)
-    return m.group(1) if m else ""
+    return (page.nm_hint if page else None) or ""
 
 
-def _json(url: str) -> Optional[dict]:
+async def _json(url: str) -> Optional[dict]:
     try:
-        with httpx.Client(timeout=10, follow_redirects=True) as c:
-            r = c.get(url, headers={"Accept": "application/json"})
+        r = await http_client("wb_api").get(url, headers={"Accept": "application/json"})
         return r.json() if r.status_code == 200 else None
     except Exception:
         return None
 
 
-def _best_product(nm: str) -> Optional[Dict[str, Any]]:
-    best = None
-    best_price = None
-    for spp in SPP:
-        for dest in DESTS:
-            url = f"https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest={dest}&spp={spp}&nm={nm}"
+def _card_price(prod: Dict[str, Any]) -> Optional[int]:
+    for k in ("salePriceU", "priceU", "salePrice", "price"):
+        v = prod.get(k)
+        if isinstance(v, (int, float)):
+            return int(round(float(v) / 100))
+    return None
+
+
+async def _best_product(nm: str) -> Optional[Dict[str, Any]]:
+    """
+    Параллельный опрос card.wb.ru по всем SPP × DESTS.
+    Выбор тот же, что и при последовательном обходе: минимальная цена,
+    при равенстве — более ранняя пара (spp, dest) в порядке SPP × DESTS.
+    Ранняя остановка: как только ответили все DESTS для последнего SPP
+    (максимальная скидка — обычно самая низкая цена) и цена уже есть.
+    Поэтому задачи последнего SPP создаются первыми — семафор отдаёт слоты в порядке
+    очереди, и эта волна уходит сразу, а не после остальных; idx остаётся из SPP × DESTS.
+    """
+    combos = [(spp, dest) for spp in SPP for dest in DESTS]
+    sem = asyncio.Semaphore(settings.wb_api_concurrency)
+    results: Dict[int, tuple[int, Dict[str, Any]]] = {}
+
+    async def one(idx: int, spp: int, dest: str) -> int:
+        url = f"https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest={dest}&spp={spp}&nm={nm}"
+        async with sem:
             log.info("WB API try: %s", url)
-            data = _json(url)
-            if not isinstance(data, dict):
-                continue
+            data = await _json(url)
+        if isinstance(data, dict):
             products = (data.get("data") or {}).get("products") or []
-            if not products:
-                continue
-            prod = products[0]
-
-            # оценим цену
-            p = None
-            for k in ("salePriceU", "priceU", "salePrice", "price"):
-                v = prod.get(k)
-                if isinstance(v, (int, float)):
-                    p = int(round(float(v) / 100))
-                    break
-            if p is None:
-                continue
-
-            if best_price is None or p < best_price:
-                best, best_price = prod, p
+            if products:
+                p = _card_price(products[0])
+                if p is not None:
+                    results[idx] = (p, products[0])
+        return idx
+
+    last_spp = {i for i, (spp, _) in enumerate(combos) if spp == SPP[-1]}
+    order = sorted(range(len(combos)), key=lambda i: i not in last_spp)
+    tasks = [asyncio.create_task(one(i, *combos[i])) for i in order]
+    try:
+        for fut in asyncio.as_completed(tasks, timeout=settings.wb_api_deadline_s):
+            last_spp.discard(await fut)
+            if not last_spp and results:
+                break
+    except asyncio.TimeoutError:
+        log.info("WB API deadline (%.1fs) for nm=%s, answered=%d/%d",
+                 settings.wb_api_deadline_s, nm, len(results), len(combos))
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    best = None
+    best_price = None
+    for idx in sorted(results):
+        p, prod = results[idx]
+        if best_price is None or p < best_price:
+            best, best_price = prod, p
     return best
 
 
-def _head_ok(url: str) -> bool:
+async def _head_ok(url: str) -> bool:
     try:
-        with httpx.Client(timeout=6, follow_redirects=True) as c:
-            r = c.head(url)
+        r = await http_client("wb_basket").head(url)
         return r.status_code == 200
     except Exception:
         return False
 
 
-def _pick_image_base(nm: str) -> Optional[tuple[str, str]]:
+async def _pick_image_base(nm: str) -> Optional[tuple[str, str]]:
     """
     Возвращает кортеж (base_url, ext), где base_url = .../images/{folder} (без '/1.ext').
-    Проверяем только первый кадр (1.webp/jpg) и запоминаем расширение.
+    Хост basket-XX берём из таблицы vol -> корзина (см. wb_basket); перебор — только фоллбек.
     """
     try:
         n = int(nm)
     except Exception:
         return None
+    return await RESOLVER.resolve(n, _head_ok)
 
-    vol = n // 100000
-    part = n // 1000
-
-    folders = ("big", "c516x688", "c246x328")
-    exts = ("webp", "jpg")
-    templates = (
-        f"/vol{vol}/part{part}/{nm}/images/{{folder}}/1.{{ext}}",
-        f"/vol{vol}/{nm}/images/{{folder}}/1.{{ext}}",  # редкий путь без part
-    )
-
-    # корзины 01..35; начнём "с ближней" чтобы быстрее попасть
-    start = (n % 20) + 1
-    for i in list(range(start, 36)) + list(range(1, start)):
-        host = f"https://basket-{i:02d}.wbbasket.ru"
-        for tmpl in templates:
-            for folder in folders:
-                for ext in exts:
-                    probe = host + tmpl.format(folder=folder, ext=ext)
-                    if _head_ok(probe):
-                        return (probe.rsplit("/", 1)[0], ext)
-    return None
 
+_FRAME_RE = re.compile(r"^(.*/images/)(?:big|c516x688|c246x328)/(\d+)\.(webp|jpg)$")
 
-def _images_from_html(html: str) -> List[str]:
+
+def _images_from_page(page: PageExtract) -> List[str]:
     """
-    Резервный источник: достаём ссылки на фото прямо со страницы.
+    Резервный источник: ссылки на фото со страницы (их собрал page_extract).
     Подойдут big, c516x688 и c246x328. Возвращаем уникальный упорядоченный список.
-    Если попались миниатюры c246x328 — пробуем заменить сегмент пути на 'big'
+    Если попались миниатюры c246x328 — заменяем сегмент пути на 'big'
     (на сервере эти файлы, как правило, существуют).
     """
-    if not html:
-        return []
-
-    # 1) соберём все ссылки на кадры 1..N из любых размеров
-    found = re.findall(
-        r"https://basket-\d{2}\.wbbasket\.ru/vol\d+/(?:part\d+/)?\d+/images/(?:big|c516x688|c246x328)/(\d+)\.(?:webp|jpg)",
-        html,
-    )
-    if not found:
+    frames = [m for m in map(_FRAME_RE.match, page.basket_images) if m]
+    if not frames:
         return []
 
-    # 2) вытащим БАЗУ (без номера и расширения) из первого матча любого размера
-    m = re.search(
-        r"(https://basket-\d{2}\.wbbasket\.ru/vol\d+/(?:part\d+/)?\d+/images/)(?:big|c516x688|c246x328)/1\.(webp|jpg)",
-        html,
-    )
-    base_prefix, ext = (m.group(1), m.group(2)) if m else (None, "webp")
-
-    # 3) построим последовательность кадров 1..max, предпочитая 'big'
-    #    (Telegram отлично ест webp/jpg; оставим исходное расширение)
-    idxs = sorted({int(x) for x in found})
-    images: List[str] = []
-    for i in idxs:
-        if base_prefix:
-            images.append(f"{base_prefix}big/{i}.{ext}")
-        else:
-            # если не удалось выделить базу — достанем прямые ссылки (включая миниатюры)
-            pass
-
-    # 4) если база не распознана, вытащим прямые URL всех размеров и уберём дубли
-    if not images:
-        raw_urls = re.findall(
-            r"https://basket-\d{2}\.wbbasket\.ru/vol\d+/(?:part\d+/)?\d+/images/(?:big|c516x688|c246x328)/\d+\.(?:webp|jpg)",
-            html,
-        )
-        for u in raw_urls:
-            if u not in images:
-                images.append(u)
+    # база (без размера и номера) и расширение — из кадра 1, если он есть
+    first = next((m for m in frames if m.group(2) == "1"), None)
+    if first is None:
+        # база не распознана — отдаём прямые ссылки (включая миниатюры)
+        return page.basket_images[:10]
+    base_prefix, ext = first.group(1), first.group(3)
 
-    # ограничимся первыми 10 (боту всё равно надо 4)
-    return images[:10]
+    # последовательность кадров, предпочитая 'big'; ограничимся первыми 10 (боту всё равно надо 4)
+    idxs = sorted({int(m.group(2)) for m in frames})
+    return [f"{base_prefix}big/{i}.{ext}" for i in idxs][:10]
 
 
-def _build_images(nm: str, prod: Dict[str, Any]) -> List[str]:
+async def _build_images(nm: str, prod: Dict[str, Any], page: Optional[PageExtract] = None) -> List[str]:
     """
     1) Берём базу из basket-XX (одной проверкой), после этого просто строим 1..N
        без HEAD на каждый кадр — так быстрее и WB не режет по HEAD.
@@ -173,25 +155,21 @@ def _build_images(nm: str, prod: Dict[str, Any]) -> List[str]:
             count = int(cnt)
         except Exception:
             count = 0
+    page = page or PageExtract()
     if count <= 0:
-        # попробуем оценить по HTML (поиск последних индексов)
-        html = getattr(settings, "_last_html", "") or ""
-        m = re.findall(r"/images/(?:big|c516x688|c246x328)/(\d+)\.(?:webp|jpg)", html)
-        if m:
-            try:
-                count = max(int(x) for x in m)
-            except Exception:
-                count = 0
+        # попробуем оценить по странице (последний индекс кадра)
+        idxs = [int(m.group(2)) for m in map(_FRAME_RE.match, page.basket_images) if m]
+        count = max(idxs, default=0)
     if count <= 0:
         count = 8  # разумная «крыша»
 
-    base = _pick_image_base(nm)
+    base = await _pick_image_base(nm)
     if base:
         base_url, ext = base
         return [f"{base_url}/{i}.{ext}" for i in range(1, count + 1)]
 
     # 2) со страницы (теперь умеем видеть и миниатюры)
-    html_imgs = _images_from_html(getattr(settings, "_last_html", "") or "")
+    html_imgs = _images_from_page(page)
     if html_imgs:
         return html_imgs
 
@@ -218,9 +196,9 @@ def _price_from(prod: Dict[str, Any]) -> Optional[int]:
     return None
 
 
-def _meta_description(html: str) -> Optional[str]:
-    m = re.search(r'<meta\s+name=["\']description["\']\s+content=["\'](.+?)["\']', html or "", re.I)
-    return m.group(1).strip() if m else None
+def _meta_description(page: PageExtract) -> Optional[str]:
+    d = (page.meta.get("description") or "").strip()
+    return d or None
 
 def _looks_like_site_meta(text: Optional[str]) -> bool:
     if not text:
@@ -229,14 +207,9 @@ def _looks_like_site_meta(text: Optional[str]) -> bool:
     # типичный текст из мета-тегов WB (см. твою страницу)
     return "коллекции женской, мужской и детской одежды" in s and "информация о доставке" in s
 
-def parse_wb(url: str) -> Dict[str, Any]:
-    r = run_get_page_data(url, settings, site="wb") or {}
-    html = r.get("html", "") or ""
-    # запишем html в settings для резервного чтения картинок (без проброса больших структур)
-    try:
-        settings._last_html = html  # type: ignore[attr-defined]
-    except Exception:
-        pass
+async def parse_wb_async(url: str) -> Dict[str, Any]:
+    r = await run_get_page_data_async(url, settings, site="wb") or {}
+    page = await page_extract(r)
 
     title = description = rating = None
     reviews = None
@@ -245,7 +218,7 @@ def parse_wb(url: str) -> Dict[str, Any]:
     videos: List[str] = []
 
     # 1) JSON-LD
-    ld = parse_ld_list(html, r.get("ld_scripts") or [])
+    ld = parse_ld_list(page.ld_json)
     product = first_product(ld)
     if product:
         t, d, rat, rev, imgs = product_fields(product)
@@ -255,11 +228,11 @@ def parse_wb(url: str) -> Dict[str, Any]:
         reviews = reviews or rev
         images = normalize_urls(images + imgs)
 
-    nm = _nm_from(url, html)
+    nm = _nm_from(url, page)
     log.info("WB nm detection: %s (src=url/html)", nm or "-")
 
     # 2) WB API (для цены, названия, количества фоток)
-    prod = _best_product(nm) if nm else None
+    prod = await _best_product(nm) if nm else None
     if prod:
         title = title or prod.get("name")
         description = description or prod.get("description")
@@ -273,18 +246,18 @@ def parse_wb(url: str) -> Dict[str, Any]:
         reviews = reviews or prod.get("feedbacks") or prod.get("feedbacksCount")
         price = price or _price_from(prod)
         if not images:
-            images = _build_images(nm, prod)
+            images = await _build_images(nm, prod, page)
 
     # 3) мета-описание как запасной вариант
     if not description:
-        description = _meta_description(html)
+        description = _meta_description(page)
     # НЕ подставляем общий meta WB вместо описания товара
     if _looks_like_site_meta(description):
         description = None
 
-    # 4) если картинок всё ещё нет — попробуем вытащить хотя бы из текущего HTML напрямую
+    # 4) если картинок всё ещё нет — попробуем взять хотя бы со страницы
     if not images:
-        images = _images_from_html(html)
+        images = _images_from_page(page)
 
     return {
         "title": title or "Товар",
@@ -295,3 +268,14 @@ def parse_wb(url: str) -> Dict[str, Any]:
         "images": images,
         "videos": videos,
     }
+
+
+def parse_wb(url: str) -> Dict[str, Any]:
+    """Синхронная обёртка над parse_wb_async (для скриптов вроде debug_dump.py)."""
+    async def _once():
+        try:
+            return await parse_wb_async(url)
+        finally:
+            await close_pool()
+            await HTTP.aclose()
+    return asyncio.run(_once())
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+log = logging.getLogger("bot.parsers.wb_basket")
+
+HeadFn = Callable[[str], Awaitable[bool]]
+
+# Примерная раскладка vol -> basket-XX (верхняя граница vol включительно).
+# Хвост таблицы экстраполирован; точные значения уточняются обучением (см. BasketResolver.learn).
+VOL_TABLE: List[Tuple[int, int]] = [
+    (143, 1), (287, 2), (431, 3), (719, 4), (1007, 5), (1061, 6), (1115, 7),
+    (1169, 8), (1313, 9), (1601, 10), (1655, 11), (1919, 12), (2045, 13),
+    (2189, 14), (2405, 15), (2621, 16), (2837, 17), (3053, 18), (3269, 19),
+    (3485, 20), (3701, 21), (3917, 22), (4133, 23), (4349, 24), (4565, 25),
+    (4877, 26), (5189, 27), (5501, 28), (5813, 29), (6125, 30), (6437, 31),
+    (6749, 32), (7061, 33), (7373, 34), (7685, 35), (7997, 36), (8309, 37),
+]
+MAX_HOST = 40
+
+FOLDERS = ("big", "c516x688", "c246x328")
+EXTS = ("webp", "jpg")
+
+
+def _host_url(host: int) -> str:
+    return f"https://basket-{host:02d}.wbbasket.ru"
+
+
+def _path(nm: int, folder: str, ext: str, with_part: bool = True) -> str:
+    vol, part = nm // 100000, nm // 1000
+    if with_part:
+        return f"/vol{vol}/part{part}/{nm}/images/{folder}/1.{ext}"
+    return f"/vol{vol}/{nm}/images/{folder}/1.{ext}"  # редкий путь без part
+
+
+def table_host(vol: int) -> int:
+    i = bisect.bisect_left(VOL_TABLE, (vol, 0))
+    return VOL_TABLE[i][1] if i < len(VOL_TABLE) else VOL_TABLE[-1][1]
+
+
+class BasketResolver:
+    """
+    vol -> basket-XX: статическая таблица + выученные точки (data/wb_baskets.json).
+    Хосты монотонно растут с vol, поэтому соседние выученные точки сужают прогноз.
+    Учим только хост: папка, расширение и путь без part бывают своими у отдельных товаров.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # vol -> host
+        self.points: Dict[int, int] = {}
+        self._vols: List[int] = []
+        self._loaded = False
+
+    def load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            # старый формат хранил [host, folder, ext, with_part] — берём только хост
+            self.points = {int(k): int(v[0] if isinstance(v, list) else v)
+                           for k, v in (raw.get("points") or {}).items()}
+        except FileNotFoundError:
+            self.points = {}
+        except Exception as e:
+            log.warning("basket table %s is broken, starting fresh: %s", self.path, e)
+            self.points = {}
+        self._vols = sorted(self.points)
+
+    def recent_hosts(self, n: int = 3) -> List[int]:
+        """Самые «свежие» корзины — туда попадают новые товары."""
+        self.load()
+        hosts = set(self.points.values()) | {h for _, h in VOL_TABLE}
+        return sorted(hosts)[-n:]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"points": {str(k): v for k, v in sorted(self.points.items())}}, f)
+        os.replace(tmp, self.path)
+
+    def learn(self, vol: int, host: int):
+        if self.points.get(vol) == host:
+            return
+        if vol not in self.points:
+            bisect.insort(self._vols, vol)
+        self.points[vol] = host
+        try:
+            self.save()
+        except Exception as e:
+            log.debug("basket table save failed: %s", e)
+
+    def predict(self, vol: int) -> int:
+        self.load()
+        if vol in self.points:
+            return self.points[vol]
+        i = bisect.bisect_left(self._vols, vol)
+        lo = self.points[self._vols[i - 1]] if i > 0 else None
+        hi = self.points[self._vols[i]] if i < len(self._vols) else None
+        if lo is not None and lo == hi:
+            return lo
+        host = table_host(vol)
+        if lo is not None and lo > host:
+            host = lo
+        if hi is not None and hi < host:
+            host = hi
+        return host
+
+    async def resolve(self, nm: int, head_ok: HeadFn) -> Optional[Tuple[str, str]]:
+        """(base_url, ext) для кадра 1; обычно 1 запрос (big/webp на известном хосте), иначе параллельный перебор."""
+        self.load()
+        vol = nm // 100000
+        host = self.predict(vol)
+        probe = _host_url(host) + _path(nm, "big", "webp")
+        if await head_ok(probe):
+            self.learn(vol, host)
+            return probe.rsplit("/", 1)[0], "webp"
+
+        log.info("WB basket: miss for vol=%s on basket-%02d, probing", vol, host)
+        return await self._probe(nm, host, head_ok)
+
+    async def _probe(self, nm: int, near: int, head_ok: HeadFn) -> Optional[Tuple[str, str]]:
+        vol = nm // 100000
+        hosts = sorted(range(1, MAX_HOST + 1), key=lambda h: (abs(h - near), h))
+        cands = [(h, wp, folder, ext)
+                 for h in hosts for wp in (True, False) for folder in FOLDERS for ext in EXTS
+                 if (h, wp, folder, ext) != (near, True, "big", "webp")]
+        sem = asyncio.Semaphore(settings.wb_basket_probe_concurrency)
+
+        async def one(c):
+            h, wp, folder, ext = c
+            async with sem:
+                ok = await head_ok(_host_url(h) + _path(nm, folder, ext, wp))
+            return c if ok else None
+
+        tasks = [asyncio.create_task(one(c)) for c in cands]
+        found = None
+        try:
+            for fut in asyncio.as_completed(tasks, timeout=settings.wb_basket_probe_deadline_s):
+                found = await fut
+                if found:
+                    break
+        except asyncio.TimeoutError:
+            log.info("WB basket: probe deadline for nm=%s", nm)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if not found:
+            return None
+        h, wp, folder, ext = found
+        self.learn(vol, h)
+        probe = _host_url(h) + _path(nm, folder, ext, wp)
+        return probe.rsplit("/", 1)[0], ext
+
+
+RESOLVER = BasketResolver(settings.wb_basket_table_path)
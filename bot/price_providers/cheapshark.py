@@ -1,23 +1,21 @@
 
-import httpx
 from typing import Optional
+from ..utils.http import http_client
 
 API_BASE = "https://www.cheapshark.com/api/1.0"
 
 async def search_games(title: str) -> list[dict]:
     params = {"title": title, "limit": 5, "exact": 0}
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(f"{API_BASE}/games", params=params)
-        r.raise_for_status()
-        return r.json() or []
+    r = await http_client("cheapshark").get(f"{API_BASE}/games", params=params)
+    r.raise_for_status()
+    return r.json() or []
 
 async def game_lookup(game_id: str) -> dict | None:
     params = {"id": game_id}
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(f"{API_BASE}/games", params=params)
-        r.raise_for_status()
-        data = r.json()
-        return data or None
+    r = await http_client("cheapshark").get(f"{API_BASE}/games", params=params)
+    r.raise_for_status()
+    data = r.json()
+    return data or None
 
 async def best_price_by_title(title: str) -> tuple[Optional[int], Optional[str], Optional[str], Optional[str]]:
     """Return (price_cents, currency, title, deal_url) in USD."""
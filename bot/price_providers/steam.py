@@ -1,6 +1,7 @@
 
-import httpx
-from typing import Optional
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+from ..utils.http import http_client
 
 STEAM_APPDETAILS_URL = "https://store.steampowered.com/api/appdetails"
 
@@ -11,14 +12,13 @@ async def get_appdetails(appid: int, cc: str = "ru", lang: str = "russian") -> d
         "cc": cc,
         "l": lang,
     }
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.get(STEAM_APPDETAILS_URL, params=params)
-        r.raise_for_status()
-        data = r.json()
-        item = data.get(str(appid))
-        if not item or not item.get("success"):
-            return None
-        return item.get("data") or {}
+    r = await http_client("steam").get(STEAM_APPDETAILS_URL, params=params)
+    r.raise_for_status()
+    data = r.json()
+    item = data.get(str(appid))
+    if not item or not item.get("success"):
+        return None
+    return item.get("data") or {}
 
 async def get_price_by_appid(appid: int, cc: str = "ru", lang: str = "russian") -> tuple[Optional[int], Optional[str], Optional[str]]:
     """Return (price_cents, currency, name) for given appid."""
@@ -32,3 +32,50 @@ async def get_price_by_appid(appid: int, cc: str = "ru", lang: str = "russian")
     if final is None or currency is None:
         return None, None, name
     return int(final), currency, name
+
+async def _price_overviews(appids: list[int], cc: str, lang: str) -> dict[int, tuple[Optional[int], Optional[str], Optional[str]]]:
+    # со списком appids Steam принимает только filters=price_overview (без name)
+    params = {
+        "appids": ",".join(str(a) for a in appids),
+        "filters": "price_overview",
+        "cc": cc,
+        "l": lang,
+    }
+    r = await http_client("steam").get(STEAM_APPDETAILS_URL, params=params)
+    r.raise_for_status()
+    data = r.json() or {}
+    out = {}
+    for appid in appids:
+        item = data.get(str(appid)) or {}
+        body = item.get("data") if item.get("success") else None
+        # бесплатные игры приходят с data=[]
+        pov = (body.get("price_overview") or {}) if isinstance(body, dict) else {}
+        final, currency = pov.get("final"), pov.get("currency")
+        if final is None or currency is None:
+            out[appid] = (None, None, None)
+        else:
+            out[appid] = (int(final), currency, None)
+    return out
+
+async def get_prices_by_appids(
+    appids: list[int], cc: str = "ru", lang: str = "russian",
+    chunk_size: int = 50,
+    call: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]] = None,
+) -> dict[int, tuple[Optional[int], Optional[str], Optional[str]]]:
+    """
+    Цены для многих appid за несколько запросов: {appid: (price_cents, currency, None)}.
+    Имени в пакетном ответе нет. Чанки идут параллельно; call — обёртка запроса
+    (rate limit, повторы). appid из упавших чанков в ответе отсутствуют.
+    """
+    uniq = list(dict.fromkeys(int(a) for a in appids))
+    chunks = [uniq[i:i + chunk_size] for i in range(0, len(uniq), chunk_size)]
+
+    async def one(chunk):
+        fn = lambda: _price_overviews(chunk, cc, lang)
+        return await (call(fn) if call else fn())
+
+    result: dict[int, tuple[Optional[int], Optional[str], Optional[str]]] = {}
+    for res in await asyncio.gather(*(one(c) for c in chunks), return_exceptions=True):
+        if isinstance(res, dict):
+            result.update(res)
+    return result
@@ -1,56 +1,226 @@
 
-import asyncio
+import asyncio, logging, random, time
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple, TypeVar
 from aiogram import Bot
-from .db import get_all_tracks, update_track_price, mark_notified
-from .price_providers.steam import get_price_by_appid
-from .price_providers.cheapshark import best_price_by_title
+from .config import settings
+from .db import (iter_due_tracks, next_due_at, flush_writes,
+                 update_track_price, reschedule_track, mark_notified)
+from .history import record_price, price_stats, maintain_history
+from .models import Track, lookup_key, track_key
+from .utils.ratelimit import TokenBucket
+
+log = logging.getLogger("bot.scheduler")
+
+T = TypeVar("T")
+
+STEAM_LIMIT = TokenBucket(settings.steam_rps, settings.steam_burst)
+CHEAPSHARK_LIMIT = TokenBucket(settings.cheapshark_rps, settings.cheapshark_burst)
+
+async def _call(bucket: TokenBucket, fn: Callable[[], Awaitable[T]]) -> T:
+    """Вызов провайдера под его rate limit с повторами (экспоненциальная пауза + jitter)."""
+    attempts = max(1, settings.price_retries)
+    for i in range(attempts):
+        await bucket.acquire()
+        try:
+            return await fn()
+        except Exception as e:
+            if i == attempts - 1:
+                raise
+            delay = settings.price_retry_base_s * (2 ** i)
+            delay = random.uniform(delay / 2, delay * 1.5)
+            log.debug("provider call failed (%s), retry %d in %.1fs", e, i + 1, delay)
+            await asyncio.sleep(delay)
+
+class Quote(NamedTuple):
+    price_cents: Optional[int]
+    currency: Optional[str]
+    title: Optional[str]
+    link: Optional[str]
+
+async def _fetch_quote(t: Track) -> Quote:
+    # провайдеры (и httpx за ними) грузятся при первой проверке, а не при старте бота
+    from .price_providers.steam import get_price_by_appid
+    from .price_providers.cheapshark import best_price_by_title
+    if t.mode == "steam" and t.steam_appid:
+        price_cents, curr, name = await _call(
+            STEAM_LIMIT, lambda: get_price_by_appid(t.steam_appid, cc="ru", lang="russian"))
+        return Quote(price_cents, curr, name, f"https://store.steampowered.com/app/{t.steam_appid}/")
+    # any-store via CheapShark in USD
+    price_cents, _curr, gtitle, deal_url = await _call(
+        CHEAPSHARK_LIMIT, lambda: best_price_by_title(t.title))
+    return Quote(price_cents, "USD", gtitle, deal_url)
+
+class _QuoteMemo:
+    """Цены за один цикл: по ключу запрос выполняется один раз, остальные треки ждут его результат."""
+
+    def __init__(self):
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._batches: list = []
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def get(self, t: Track) -> Quote:
+        key = lookup_key(t)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.create_task(_fetch_quote(t))
+        return await asyncio.shield(task)
+
+    def prefetch_steam(self, tracks: Iterable[Track]):
+        """Steam-цены для пачки треков одним пакетным запросом (по чанкам appid)."""
+        pending: Dict[int, Track] = {}
+        for t in tracks:
+            key = lookup_key(t)
+            if key[0] == "steam" and key not in self._tasks:
+                pending.setdefault(t.steam_appid, t)
+        if not pending:
+            return
+        from .price_providers.steam import get_prices_by_appids
+        batch = asyncio.create_task(get_prices_by_appids(
+            list(pending), cc="ru", lang="russian",
+            chunk_size=settings.steam_batch_size,
+            call=lambda fn: _call(STEAM_LIMIT, fn),
+        ))
+        self._batches.append(batch)
+        for appid, t in pending.items():
+            self._tasks[("steam", str(appid))] = asyncio.create_task(self._from_batch(batch, t))
+
+    @staticmethod
+    async def _from_batch(batch: "asyncio.Task", t: Track) -> Quote:
+        prices = await asyncio.shield(batch)
+        if t.steam_appid not in prices:
+            # чанк не удался — спросим эту игру отдельно
+            return await _fetch_quote(t)
+        price_cents, curr, _ = prices[t.steam_appid]
+        return Quote(price_cents, curr, None, f"https://store.steampowered.com/app/{t.steam_appid}/")
+
+    def cancel(self):
+        for task in [*self._tasks.values(), *self._batches]:
+            task.cancel()
+
+def next_interval(t: Track, price_cents: Optional[int]) -> int:
+    """
+    Адаптивный интервал до следующей проверки:
+    около цели — чаще всего, цена двигается — вдвое чаще, стабильна — реже (до максимума).
+    """
+    lo, base, hi = settings.check_min_interval_s, settings.check_interval_s, settings.check_max_interval_s
+    if price_cents is None:
+        return base
+    prev = t.check_interval_s or base
+    gap = (price_cents - t.target_price_cents) / max(t.target_price_cents, 1)
+    if gap <= settings.check_near_target:
+        iv = lo
+    elif t.last_price_cents is not None and price_cents != t.last_price_cents:
+        iv = prev // 2
+    else:
+        iv = prev * 2
+    iv = min(hi, max(lo, iv))
+    # немного разброса, чтобы треки не собирались в одну секунду
+    return int(iv * random.uniform(0.9, 1.1))
+
+async def _check_track(bot: Bot, t: Track, quotes: _QuoteMemo):
+    q = await quotes.get(t)
+    price_cents = q.price_cents
+    title = q.title or t.title
+    if t.mode == "steam" and t.steam_appid:
+        currency = q.currency or t.currency
+        link = t.url or q.link
+    else:
+        currency = "USD"
+        link = q.link or t.url
+
+    iv = next_interval(t, price_cents)
+    await update_track_price(t.id, price_cents, int(time.time()) + iv, iv)
+    await record_price(track_key(t), price_cents)
+
+    if price_cents is None:
+        return
+
+    # notify if reached
+    if price_cents <= t.target_price_cents and (t.last_notified_price_cents is None or price_cents < (t.last_notified_price_cents or 1e18)):
+        text = (f"🔔 <b>{title}</b> сейчас {price_cents/100:.2f} {currency} "
+                f"(ваша цель {t.target_price_cents/100:.2f} {t.currency}).")
+        days = settings.history_notify_days
+        stats = await price_stats(track_key(t), days)
+        if stats.min_cents is not None and stats.min_cents < price_cents:
+            text += f"\nМинимум за {days} дн.: {stats.min_cents/100:.2f} {currency}"
+        if link:
+            text += f"\nСсылка: {link}"
+        try:
+            await bot.send_message(t.user_id, text, parse_mode='HTML', disable_web_page_preview=False)
+        except Exception:
+            pass
+        await mark_notified(t.id, price_cents)
 
 async def check_prices(bot: Bot):
-    tracks = await get_all_tracks()
-    for t in tracks:
+    """Один проход: все треки, срок проверки которых уже наступил, по порядку срочности."""
+    started = time.monotonic()
+    now = int(time.time())
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.scheduler_workers * 2)
+    stats = {"ok": 0, "failed": 0}
+    quotes = _QuoteMemo()
+    total = 0
+
+    async def worker():
+        while True:
+            t = await queue.get()
+            try:
+                if t is None:
+                    return
+                await _check_track(bot, t, quotes)
+                stats["ok"] += 1
+            except Exception as e:
+                # swallow errors per track
+                stats["failed"] += 1
+                log.debug("track #%s check failed: %s", t.id, e)
+                await reschedule_track(t.id, int(time.time()) + settings.check_retry_s)
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, settings.scheduler_workers))]
+    try:
+        # треки идут страницами и сразу в работу; очередь ограничена — память тоже
+        async for page in iter_due_tracks(now, settings.scheduler_page_size):
+            quotes.prefetch_steam(page)
+            for t in page:
+                await queue.put(t)
+            total += len(page)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+        quotes.cancel()
+
+    log.info("price cycle: %d tracks, %d unique lookups (%d ok, %d failed) in %.1fs",
+             total, len(quotes), stats["ok"], stats["failed"], time.monotonic() - started)
+
+async def run_scheduler(bot: Bot, stop: Optional[asyncio.Event] = None):
+    """
+    Основной цикл: проверяем всё, что созрело, затем спим до ближайшего next_check_at
+    (но не дольше scheduler_idle_s — чтобы подхватывать новые треки).
+    """
+    stop = stop or asyncio.Event()
+    maintained_at = 0.0
+    while not stop.is_set():
+        if time.time() - maintained_at >= 86400:
+            try:
+                await maintain_history()
+            except Exception as e:
+                log.warning("price history maintenance failed: %s", e)
+            maintained_at = time.time()
         try:
-            price_cents = None
-            currency = t.currency
-            link = t.url
-            title = t.title
-
-            if t.mode == "steam" and t.steam_appid:
-                price_cents, curr, name = await get_price_by_appid(t.steam_appid, cc="ru", lang="russian")
-                if name:
-                    title = name
-                if curr:
-                    currency = curr
-                if link is None:
-                    link = f"https://store.steampowered.com/app/{t.steam_appid}/"
-            else:
-                # any-store via CheapShark in USD
-                price_cents, curr, gtitle, deal_url = await best_price_by_title(t.title)
-                if gtitle:
-                    title = gtitle
-                if deal_url:
-                    link = deal_url
-                currency = "USD"
-
-            await update_track_price(t.id, price_cents)
-
-            if price_cents is None:
-                await asyncio.sleep(0.1)
-                continue
-
-            # notify if reached
-            if price_cents <= t.target_price_cents and (t.last_notified_price_cents is None or price_cents < (t.last_notified_price_cents or 1e18)):
-                text = (f"🔔 <b>{title}</b> сейчас {price_cents/100:.2f} {currency} "
-                        f"(ваша цель {t.target_price_cents/100:.2f} {t.currency}).")
-                if link:
-                    text += f"\nСсылка: {link}"
-                try:
-                    await bot.send_message(t.user_id, text, parse_mode='HTML', disable_web_page_preview=False)
-                except Exception:
-                    pass
-                await mark_notified(t.id, price_cents)
-
-            await asyncio.sleep(0.2)  # soft throttle
+            await check_prices(bot)
+            await flush_writes()
+            nxt = await next_due_at()
         except Exception as e:
-            # swallow errors per track
-            await asyncio.sleep(0.1)
-            continue
+            log.warning("price cycle failed: %s", e)
+            nxt = None
+        idle = settings.scheduler_idle_s
+        delay = idle if nxt is None else min(idle, max(1.0, nxt - time.time()))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import aiosqlite
+
+from ..config import settings
+
+log = logging.getLogger("bot.state.product_cache")
+
+Loader = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+CREATE_SQL = '''
+CREATE TABLE IF NOT EXISTS product_cache (
+  key TEXT PRIMARY KEY,
+  data TEXT NOT NULL,
+  price_at REAL NOT NULL,
+  static_at REAL NOT NULL
+);
+'''
+
+# как часто put() чистит с диска записи старше static_ttl
+PRUNE_EVERY_S = 3600
+
+
+class ProductCache:
+    """
+    Кэш распарсенных товаров по ключу "ozon:<id>" / "wb:<nm>".
+    Два уровня: LRU в памяти + sqlite на диске (переживает рестарт).
+    Цена живёт price_ttl, статика (название, описание, фото) — static_ttl.
+    Если цена устарела, а статика ещё свежая — отдаём сразу и обновляем в фоне.
+    Строки старше static_ttl удаляются с диска в warm() и не чаще раза в PRUNE_EVERY_S из put().
+    Соединение с sqlite одно на всё время работы.
+    """
+
+    def __init__(self, path: str, max_items: int = 512, price_ttl: float = 900, static_ttl: float = 7 * 86400):
+        self.path = path
+        self.max_items = max_items
+        self.price_ttl = price_ttl
+        self.static_ttl = static_ttl
+        self._mem: "OrderedDict[str, dict]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._conn_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._pruned_at = 0.0
+
+    async def _db(self) -> aiosqlite.Connection:
+        if self._conn is not None:
+            return self._conn
+        async with self._conn_lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                db = await aiosqlite.connect(self.path)
+                await db.executescript(CREATE_SQL)
+                await db.commit()
+                self._conn = db
+        return self._conn
+
+    async def warm(self):
+        db = await self._db()
+        async with self._write_lock:
+            await self._prune(db, time.time())
+            await db.commit()
+
+    async def _prune(self, db: aiosqlite.Connection, now: float):
+        cur = await db.execute("DELETE FROM product_cache WHERE static_at < ?", (now - self.static_ttl,))
+        self._pruned_at = now
+        if cur.rowcount:
+            log.info("product cache: pruned %d expired rows", cur.rowcount)
+
+    async def close(self):
+        if self._conn is not None:
+            db, self._conn = self._conn, None
+            await db.close()
+
+    def _remember(self, key: str, entry: dict):
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    async def _read(self, key: str) -> Optional[dict]:
+        entry = self._mem.get(key)
+        if entry is not None:
+            self._mem.move_to_end(key)
+            return entry
+        try:
+            db = await self._db()
+            cur = await db.execute(
+                "SELECT data, price_at, static_at FROM product_cache WHERE key=?", (key,)
+            )
+            row = await cur.fetchone()
+        except Exception as e:
+            log.debug("product cache read failed for %s: %s", key, e)
+            return None
+        if not row:
+            return None
+        entry = {"data": json.loads(row[0]), "price_at": row[1], "static_at": row[2]}
+        self._remember(key, entry)
+        return entry
+
+    async def put(self, key: str, data: Dict[str, Any]):
+        now = time.time()
+        entry = {"data": data, "price_at": now, "static_at": now}
+        self._remember(key, entry)
+        try:
+            db = await self._db()
+            async with self._write_lock:
+                await db.execute(
+                    "INSERT OR REPLACE INTO product_cache(key, data, price_at, static_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(data, ensure_ascii=False), now, now),
+                )
+                if now - self._pruned_at >= PRUNE_EVERY_S:
+                    await self._prune(db, now)
+                await db.commit()
+        except Exception as e:
+            log.debug("product cache write failed for %s: %s", key, e)
+
+    async def _load_and_put(self, key: str, loader: Loader) -> Optional[Dict[str, Any]]:
+        data = await loader()
+        if _cacheable(data):
+            await self.put(key, data)
+        return data
+
+    def _refresh_in_background(self, key: str, loader: Loader):
+        if key in self._refreshing:
+            return
+
+        async def _run():
+            try:
+                await self._load_and_put(key, loader)
+                log.info("product cache: refreshed %s", key)
+            except Exception as e:
+                log.info("product cache: background refresh of %s failed: %s", key, e)
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(_run())
+
+    async def get_or_load(self, key: str, loader: Loader) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        entry = await self._read(key)
+        if entry is not None and now - entry["static_at"] < self.static_ttl:
+            if now - entry["price_at"] >= self.price_ttl:
+                log.info("product cache: stale price for %s, serving and refreshing", key)
+                self._refresh_in_background(key, loader)
+            else:
+                log.info("product cache: hit %s", key)
+            return entry["data"]
+        return await self._load_and_put(key, loader)
+
+
+def _cacheable(data: Optional[Dict[str, Any]]) -> bool:
+    # не кэшируем пустые результаты (антибот, таймаут и т.п.)
+    return bool(data) and (data.get("price") is not None or bool(data.get("images")))
+
+
+PRODUCT_CACHE = ProductCache(
+    settings.product_cache_path,
+    max_items=settings.product_cache_items,
+    price_ttl=settings.product_price_ttl_s,
+    static_ttl=settings.product_static_ttl_s,
+)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых запросов: пока задача по ключу выполняется,
+    остальные вызывающие ждут её же результат (или её же исключение).
+    Задача живёт отдельно от ожидающих — отмена/таймаут одного из них её не прерывает.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks: set = set()
+
+    def inflight(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]], fut: asyncio.Future):
+        try:
+            result = await fn()
+        except BaseException as e:
+            if not fut.done():
+                fut.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            if not fut.done():
+                fut.set_result(result)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            # исключение могут так и не забрать (все ждущие ушли по таймауту) — гасим предупреждение
+            fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._inflight[key] = fut
+            task = asyncio.create_task(self._run(key, fn, fut))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if timeout is None:
+            return await asyncio.shield(fut)
+        return await asyncio.wait_for(asyncio.shield(fut), timeout)
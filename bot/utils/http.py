@@ -0,0 +1,121 @@
+
+import asyncio, logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Set
+
+import httpx
+
+from ..config import settings
+
+log = logging.getLogger("bot.http")
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+@dataclass
+class HostGroup:
+    timeout: float
+    max_connections: int
+    keepalive: int
+    http2: bool = True
+    follow_redirects: bool = True
+
+
+def _groups() -> Dict[str, HostGroup]:
+    s = settings
+    return {
+        # card.wb.ru — параллельный опрос цен
+        "wb_api": HostGroup(s.wb_api_timeout_s, s.wb_api_concurrency, s.wb_api_concurrency),
+        # basket-XX.wbbasket.ru — HEAD-пробы
+        "wb_basket": HostGroup(s.wb_basket_head_timeout_s, s.wb_basket_probe_concurrency, 8),
+        "steam": HostGroup(s.steam_timeout_s, s.http_max_connections, s.http_keepalive),
+        "cheapshark": HostGroup(s.cheapshark_timeout_s, s.http_max_connections, s.http_keepalive),
+        # www.ozon.ru composer-api; редирект там — это антибот, а не данные
+        "ozon": HostGroup(s.ozon_direct_timeout_s, s.http_max_connections, s.http_keepalive,
+                          follow_redirects=False),
+        # картинки с CDN маркетплейсов
+        "media": HostGroup(s.media_timeout_s, s.http_max_connections, s.http_keepalive),
+    }
+
+
+class HttpPools:
+    """
+    Один keep-alive httpx.AsyncClient на группу хостов (HTTP/2, если установлен h2).
+    Клиенты привязаны к event loop: в новом loop (asyncio.run в скриптах) создаются заново,
+    а старые закрываются — в своём loop, если он ещё жив, иначе в фоне в текущем.
+    """
+
+    def __init__(self):
+        self.groups = _groups()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Set[asyncio.Task] = set()
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        old_loop, old = self._loop, list(self._clients.values())
+        self._clients = {}
+        self._loop = loop
+        if not old:
+            return
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(_aclose_all(old), old_loop)
+        else:
+            # loop уже закрыт: транспорты мертвы, aclose лишь отпустит пулы; ошибки глотаем
+            task = loop.create_task(_aclose_all(old))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def get(self, group: str) -> httpx.AsyncClient:
+        self._check_loop()
+        c = self._clients.get(group)
+        if c is None or c.is_closed:
+            g = self.groups[group]
+            c = httpx.AsyncClient(
+                timeout=httpx.Timeout(g.timeout),
+                limits=httpx.Limits(max_connections=g.max_connections,
+                                    max_keepalive_connections=g.keepalive),
+                follow_redirects=g.follow_redirects,
+                http2=g.http2 and HTTP2,
+            )
+            self._clients[group] = c
+        return c
+
+    async def startup(self):
+        for name in self.groups:
+            self.get(name)
+        log.info("HTTP pools ready: %s (http2=%s)", ", ".join(self.groups), HTTP2)
+
+    async def warm(self, hosts: Dict[str, list]):
+        """Открывает keep-alive соединения (TCP+TLS) к известным хостам заранее."""
+        async def _one(group, url):
+            try:
+                await self.get(group).head(url)
+            except Exception as e:
+                log.debug("warm-up %s failed: %s", url, e)
+
+        await asyncio.gather(*(_one(g, u) for g, urls in hosts.items() for u in urls))
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        await _aclose_all(clients.values())
+
+
+async def _aclose_all(clients: Iterable[httpx.AsyncClient]):
+    for c in clients:
+        try:
+            await c.aclose()
+        except Exception as e:
+            log.debug("http client close failed: %s", e)
+
+
+HTTP = HttpPools()
+
+def http_client(group: str) -> httpx.AsyncClient:
+    return HTTP.get(group)
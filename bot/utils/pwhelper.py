@@ -1,43 +1,51 @@
 
-import concurrent.futures, pathlib, logging, time, json, os
+import asyncio, contextlib, pathlib, logging, time, json, os
+from dataclasses import dataclass
 from types import SimpleNamespace
-from .logging import setup_logging
-setup_logging()
+from typing import Optional
+from urllib.parse import urlsplit
+
+from ..config import BLOCK_TYPES, TRACKER_DOMAINS
+
 log = logging.getLogger("bot.pw")
 
-def _try_click_banners(page):
-    sels = [
-        "button:has-text('ОК')", "button:has-text('Окей')", "button:has-text('OK')",
-        "button:has-text('Понятно')", "button:has-text('Принять')",
-        "button:has-text('Согласен')", "button:has-text('Разрешить')",
-        "[data-widget*='cookie'] button", "button#onetrust-accept-btn-handler",
-        ".cookies-agree", ".cookies__btn", ".cookie-agree", ".cookie-accept",
-    ]
-    clicked = False
-    for sel in sels:
-        try:
-            el = page.query_selector(sel)
-            if el:
-                el.click(timeout=500)
-                page.wait_for_timeout(200)
-                clicked = True
-        except Exception:
-            pass
-    if not clicked:
-        try:
-            page.evaluate('''for (const el of document.querySelectorAll("div,section,aside")) {
-                  const st = getComputedStyle(el);
-                  if ((st.position==="fixed" || st.position==="sticky") && el.innerText &&
-                      /cookies|куки|рекомендательн|рек. технологии/i.test(el.innerText)) {
-                    el.style.display="none";
-                  }
-                }''')
-        except Exception:
-            pass
+# Все баннеры (cookies, геолокация, «понятно») закрываются одним скриптом в странице.
+_BANNERS_JS = r"""() => {
+    const WORDS = ["ок", "окей", "ok", "понятно", "принять", "согласен", "разрешить"];
+    const SELS = "[data-widget*='cookie'] button, button#onetrust-accept-btn-handler, " +
+                 ".cookies-agree, .cookies__btn, .cookie-agree, .cookie-accept";
+    const hits = new Set(document.querySelectorAll(SELS));
+    for (const b of document.querySelectorAll("button")) {
+        const t = (b.innerText || "").trim().toLowerCase();
+        if (t && WORDS.some((w) => t === w || t.startsWith(w + " "))) hits.add(b);
+    }
+    let clicked = 0;
+    for (const el of hits) {
+        try { el.click(); clicked++; } catch (e) {}
+    }
+    if (!clicked) {
+        for (const el of document.querySelectorAll("div,section,aside")) {
+            const st = getComputedStyle(el);
+            if ((st.position === "fixed" || st.position === "sticky") && el.innerText &&
+                /cookies|куки|рекомендательн|рек. технологии/i.test(el.innerText)) {
+                el.style.display = "none";
+            }
+        }
+    }
+    return clicked;
+}"""
+
+async def _try_click_banners(page):
+    try:
+        clicked = await page.evaluate(_BANNERS_JS)
+        if clicked:
+            log.debug("PW: dismissed %d banners", clicked)
+    except Exception as e:
+        log.debug("banners: %s", e)
 
-def _fetch_ozon_composer(page):
+async def _fetch_ozon_composer(page):
     try:
-        data = page.evaluate('''() => {
+        data = await page.evaluate('''() => {
             const path = location.pathname + location.search;
             return fetch(`/api/composer-api.bx/page/json/v2?url=${path}&__rr=1`, {credentials:'include'})
                 .then(r => r.json()).catch(() => null);
@@ -47,139 +55,605 @@ def _fetch_ozon_composer(page):
         log.debug("composer fetch failed: %s", e)
         return None
 
-def _grab_gallery_srcs(page):
-    urls = set()
-    sels = [
-        "img[src*='wbstatic']",
-        "img[src*='images.wbstatic']",
-        "img[data-src*='wbstatic']",
-        "img[data-original*='wbstatic']",
-        "picture source[srcset]",
-        ".product-page__gallery img",
-        "[data-gallery] img",
-        "img[srcset]",
-    ]
-    for sel in sels:
-        for el in page.query_selector_all(sel):
+# Компактная выжимка страницы одним evaluate: вместо page.content() (мегабайты HTML)
+# и десятков query_selector/get_attribute по IPC. Поля совпадают с parsers.extract.PageExtract.
+_EXTRACT_JS = r"""({site, states}) => {
+    const BASKET = /https:\/\/basket-\d{2}\.wbbasket\.ru\/vol\d+\/(?:part\d+\/)?\d+\/images\/(?:big|c516x688|c246x328)\/\d+\.(?:webp|jpg)/g;
+    const NM = /(?:Артикул|nmId|nm_id|productId)[^\d]{0,16}(\d{6,12})/i;
+    const out = {ld_json: [], meta: {}, og_images: [], states: {}, title: null,
+                 basket_images: [], nm_hint: null, h1: ""};
+
+    for (const s of document.querySelectorAll('script[type="application/ld+json"]'))
+        out.ld_json.push(s.textContent || "");
+    for (const m of document.querySelectorAll("meta[content]")) {
+        const k = (m.getAttribute("property") || m.getAttribute("name") || m.getAttribute("itemprop") || "").toLowerCase();
+        if (!k) continue;
+        const c = m.getAttribute("content");
+        if (k === "og:image") out.og_images.push(c);
+        if (!(k in out.meta)) out.meta[k] = c;
+    }
+    // только нужные state-блоки: у Ozon их десятки, и некоторые весят сотни КБ
+    const wanted = (id) => states.some((p) => id.startsWith(p));
+    for (const el of document.querySelectorAll("[data-state]")) {
+        const id = el.id || "data-state";
+        if (wanted(id) && !(id in out.states)) out.states[id] = el.getAttribute("data-state");
+    }
+    for (const el of document.querySelectorAll('script[id^="state-"], script#__INITIAL_STATE__')) {
+        if (wanted(el.id) && !(el.id in out.states)) out.states[el.id] = el.textContent;
+    }
+    out.title = (document.title || "").trim() || null;
+    const h1 = document.querySelector("h1");
+    out.h1 = h1 ? (h1.innerText || "").trim() : "";
+
+    if (site === "wb") {
+        const seen = new Set();
+        const add = (t) => {
+            if (!t || !t.includes("wbbasket")) return;
+            for (const u of t.match(BASKET) || []) if (!seen.has(u)) { seen.add(u); out.basket_images.push(u); }
+        };
+        for (const el of document.querySelectorAll("img, source, link, meta"))
+            for (const a of ["src", "data-src", "data-original", "srcset", "data-srcset", "href", "content"])
+                add(el.getAttribute(a));
+        for (const s of document.scripts) add(s.textContent);
+        if (!/\/catalog\/\d+\//.test(location.pathname)) {
+            const m = (document.body ? document.body.innerText : "").match(NM);
+            if (m) out.nm_hint = m[1];
+        }
+    }
+    return out;
+}"""
+
+# какие state-блоки отдавать парсеру (префиксы id)
+_STATES = {
+    "ozon": ["state-webPrice"],
+    "wb": ["state-card-app", "state-portal-app", "state-product-app", "__INITIAL_STATE__", "data-state"],
+}
+
+async def _extract_in_page(page, site: str) -> Optional[dict]:
+    try:
+        return await page.evaluate(_EXTRACT_JS, {"site": site, "states": _STATES.get(site, [])})
+    except Exception as e:
+        log.debug("in-page extract failed: %s", e)
+        return None
+
+UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+      "AppleWebKit/537.36 (KHTML, like Gecko) "
+      "Chrome/127.0.0.0 Safari/537.36")
+
+def _csv(value) -> tuple:
+    return tuple(x.strip().lower() for x in (value or "").split(",") if x.strip())
+
+def _host_in(host: str, domains) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+@dataclass(frozen=True)
+class RouteRules:
+    """Что не грузить на странице: типы ресурсов Playwright и домены (вместе с поддоменами)."""
+    block_types: frozenset
+    block_domains: tuple
+    allow_domains: tuple
+
+    def blocks(self, resource_type: str, host: str) -> bool:
+        if _host_in(host, self.allow_domains):
+            return False
+        return resource_type in self.block_types or _host_in(host, self.block_domains)
+
+
+def route_rules(settings, site: str) -> Optional[RouteRules]:
+    """Правила для сайта из settings (pw_block_*_<site>); None — перехват выключен."""
+    if not getattr(settings, "pw_block_enabled", True):
+        return None
+    return RouteRules(
+        block_types=frozenset(_csv(getattr(settings, f"pw_block_types_{site}", BLOCK_TYPES))),
+        block_domains=_csv(getattr(settings, f"pw_block_domains_{site}", TRACKER_DOMAINS)),
+        allow_domains=_csv(getattr(settings, f"pw_allow_domains_{site}", "")),
+    )
+
+async def _install_routes(page, rules: Optional[RouteRules]) -> dict:
+    stats = {"blocked": 0}
+    if rules is None:
+        return stats
+
+    async def _handle(route):
+        req = route.request
+        try:
+            # саму страницу не трогаем никогда
+            main_doc = req.is_navigation_request() and req.frame == page.main_frame
+            if not main_doc and rules.blocks(req.resource_type, urlsplit(req.url).hostname or ""):
+                stats["blocked"] += 1
+                await route.abort()
+                return
+            await route.continue_()
+        except Exception as e:
+            log.debug("route %s failed: %s", req.url, e)
+
+    await page.route("**/*", _handle)
+    return stats
+
+async def _screenshot(page, settings, site: str, reason: str) -> Optional[str]:
+    debug_dir = pathlib.Path(settings.debug_dir); debug_dir.mkdir(parents=True, exist_ok=True)
+    shot = debug_dir / f"{site}_{int(time.time()*1000)}.png"
+    try:
+        await page.screenshot(path=str(shot), full_page=True)
+        log.info("PW screenshot (%s) saved: %s", reason, shot)
+        return str(shot)
+    except Exception as e:
+        log.debug("screenshot failed: %s", e)
+        return None
+
+def _has_data(res: dict) -> bool:
+    ex = res.get("extract") or {}
+    return bool(ex.get("ld_json") or ex.get("states") or (ex.get("meta") or {}).get("og:title")
+                or res.get("composer") or res.get("html"))
+
+async def _run_job(page, url: str, settings, site: str, want_html: bool = False):
+    page.set_default_timeout(settings.playwright_timeout_ms)
+    mode = getattr(settings, "pw_screenshots", "fail")
+    if log.isEnabledFor(logging.DEBUG) and mode != "off":
+        mode = "always"
+    stats = await _install_routes(page, route_rules(settings, site))
+
+    try:
+        res = await _collect(page, url, settings, site, want_html)
+    except Exception:
+        if mode != "off":
+            await _screenshot(page, settings, site, "error")
+        raise
+    finally:
+        if stats["blocked"]:
+            log.info("PW (%s): blocked %d requests", site, stats["blocked"])
+
+    res["banned"] = _is_ban(res)
+    if res["banned"]:
+        log.warning("PW (%s): ban page (HTTP %s) for %s", site, res.get("status"), url)
+    if mode == "always" or (mode == "fail" and (res["banned"] or not _has_data(res))):
+        res["screenshot"] = await _screenshot(page, settings, site, mode)
+    return res
+
+# Достаточные признаки того, что данные товара уже в DOM. Проверяются одним предикатом в браузере.
+_READY_JS = """(site) => {
+    const q = (s) => document.querySelector(s);
+    if (q('script[type="application/ld+json"]')) return "ld+json";
+    if (site === "ozon" && q('[id^="state-webPrice"]')) return "state-webPrice";
+    if (site === "wb") {
+        if (q('script#state-card-app, script#state-portal-app, script#state-product-app, script#__INITIAL_STATE__, [data-state]'))
+            return "state-script";
+        // SPA-карточка WB: цена и фото приходят из API, со страницы нужны заголовок и галерея
+        if (q('h1')) return "h1";
+    }
+    if (site === "common" && q('meta[property="og:title"]')) return "og:title";
+    return false;
+}"""
+
+def _is_composer_page(resp) -> bool:
+    return "/api/composer-api.bx/page/json/" in resp.url and resp.status == 200
+
+async def _wait_ready(page, site: str, deadline_s: float, composer_resp=None) -> Optional[str]:
+    """
+    Гонка условий готовности: DOM-предикат и (для Ozon) ответ composer-api самой страницы.
+    Возвращает имя сработавшего условия или None, если вышел дедлайн.
+    """
+    def _dom(timeout_s):
+        return asyncio.ensure_future(page.wait_for_function(
+            _READY_JS, arg=site, polling=100, timeout=timeout_s * 1000))
+
+    waiters = {_dom(deadline_s): "dom"}
+    if composer_resp is not None:
+        waiters[composer_resp] = "composer"
+
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline_s
+    pending, reason = set(waiters), None
+    try:
+        while pending and reason is None:
+            left = end - loop.time()
+            if left <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.cancelled() or t.exception() is not None:
+                    # контекст пересоздан (редирект антибота и т.п.) — проверяем DOM заново
+                    left = end - loop.time()
+                    if waiters[t] == "dom" and left > 0 and not page.is_closed():
+                        again = _dom(left)
+                        waiters[again] = "dom"
+                        pending.add(again)
+                    continue
+                reason = waiters[t]
+                if reason == "dom":
+                    reason = await t.result().json_value()
+                break
+    finally:
+        for t in pending:
+            if t is not composer_resp:
+                t.cancel()
+        await asyncio.gather(*(t for t in pending if t is not composer_resp), return_exceptions=True)
+    return reason
+
+async def _composer_from(resp_task) -> Optional[dict]:
+    """JSON из composer-ответа, который страница уже получила сама (без повторного fetch)."""
+    if resp_task is None or not resp_task.done() or resp_task.cancelled() or resp_task.exception():
+        return None
+    try:
+        data = await resp_task.result().json()
+    except Exception:
+        return None
+    return data if isinstance(data, dict) and data.get("widgetStates") else None
+
+async def _collect(page, url: str, settings, site: str, want_html: bool = False):
+    deadline_s = getattr(settings, f"pw_ready_ms_{site}", 8000) / 1000
+    composer_resp = None
+    if site == "ozon":
+        composer_resp = asyncio.ensure_future(page.wait_for_event(
+            "response", predicate=_is_composer_page, timeout=deadline_s * 1000))
+
+    try:
+        t0 = time.monotonic()
+        log.info("PW goto (%s): %s", site, url)
+        resp = await page.goto(url, wait_until="commit")
+        reason = await _wait_ready(page, site, deadline_s, composer_resp)
+        if reason:
+            log.info("PW ready (%s) by %s in %.0f ms", site, reason, (time.monotonic() - t0) * 1000)
+        else:
+            log.info("PW ready (%s): deadline %.1fs, taking what is there", site, deadline_s)
+        await _try_click_banners(page)
+
+        if site == "wb" and reason:
             try:
-                src = el.get_attribute("src") or el.get_attribute("data-src") or el.get_attribute("data-original")
-                if not src:
-                    srcset = el.get_attribute("srcset") or el.get_attribute("data-srcset")
-                    if srcset:
-                        src = srcset.split(",")[-1].strip().split(" ")[0]
-                if src:
-                    if src.startswith("//"): src = "https:" + src
-                    urls.add(src)
+                # ленивая галерея подставляет src при прокрутке
+                await page.evaluate("window.scrollTo(0, document.body.scrollHeight/3)")
+                await page.wait_for_selector("img[src*='wbbasket'], img[src*='wbstatic']", timeout=1500)
             except Exception:
                 pass
-    return list(urls)
+    finally:
+        if composer_resp is not None and not composer_resp.done():
+            composer_resp.cancel()
+            await asyncio.gather(composer_resp, return_exceptions=True)
 
-def _get_state_script_text(page, ids=("state-card-app","state-portal-app","state-product-app","__INITIAL_STATE__")):
-    for sid in ids:
+    extract = await _extract_in_page(page, site)
+    h1 = (extract or {}).pop("h1", "")
+    composer = None
+    if site == "ozon":
+        composer = await _composer_from(composer_resp) or await _fetch_ozon_composer(page)
+
+    # полный HTML — только по запросу (debug_dump) или если выжимка не получилась
+    html = ""
+    if want_html or extract is None:
         try:
-            el = page.query_selector(f"script#{sid}")
-            if el:
-                return el.inner_text()
+            html = await page.content()
         except Exception:
-            continue
-    try:
-        el = page.query_selector("[data-state]")
-        if el:
-            return el.get_attribute("data-state")
-    except Exception:
-        pass
-    return None
+            pass
 
-def _run_sync_job(url: str, settings, site: str):
-    from playwright.sync_api import sync_playwright
-    debug_dir = pathlib.Path(settings.debug_dir); debug_dir.mkdir(parents=True, exist_ok=True)
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=not settings.show_browser,
-            slow_mo=settings.slow_mo_ms if settings.show_browser else 0,
+    return {
+        "html": html,
+        "extract": extract,
+        "h1": h1,
+        "composer": composer,
+        "screenshot": None,
+        "status": resp.status if resp is not None else None,
+        "url": page.url,
+    }
+
+
+class PoolBusy(RuntimeError):
+    """Очередь пула переполнена — новых задач не берём."""
+
+
+# признаки страницы-блокировки (антибот, капча); по ним сбрасываем сохранённую сессию
+BAN_MARKERS = ("доступ ограничен", "access denied", "подтвердите, что вы не робот", "captcha", "вы робот")
+BAN_STATUSES = (403, 429)
+
+def _is_ban(res: dict) -> bool:
+    # 403/429 первой навигации бывает и у пройденного челленджа антибота (JS-перезагрузка
+    # на товар, см. _wait_ready) — тогда данные есть, а куки допуска как раз надо сохранить
+    ex = res.get("extract") or {}
+    text = " ".join(filter(None, (ex.get("title"), res.get("h1")))).lower()
+    if any(m in text for m in BAN_MARKERS):
+        return True
+    return res.get("status") in BAN_STATUSES and not _has_data(res)
+
+
+class _Slot:
+    """
+    Один «тёплый» браузер из пула и по контексту на сайт.
+    Куки и localStorage контекста сохраняются в storage_state (<pw_state_dir>/<site>-<slot>.json)
+    и подхватываются при следующем запуске; при бане файл удаляется и сессия начинается заново.
+    """
+
+    def __init__(self, idx: int, settings):
+        self.idx = idx
+        self.settings = settings
+        self.browser = None
+        self.contexts: dict = {}
+        self._saved_at: dict = {}
+        self.pages_served = 0
+
+    async def launch(self, pw):
+        s = self.settings
+        self.browser = await pw.chromium.launch(
+            headless=not s.show_browser,
+            slow_mo=s.slow_mo_ms if s.show_browser else 0,
             args=["--disable-blink-features=AutomationControlled","--disable-dev-shm-usage","--no-sandbox","--disable-gpu"],
         )
-        ctx = browser.new_context(
-            user_agent=("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/127.0.0.0 Safari/537.36"),
+        self.pages_served = 0
+        log.info("PW slot #%d: browser launched", self.idx)
+
+    def state_path(self, site: str) -> pathlib.Path:
+        return pathlib.Path(getattr(self.settings, "pw_state_dir", "data/pw_state")) / f"{site}-{self.idx}.json"
+
+    def _fresh_state(self, site: str) -> Optional[str]:
+        path = self.state_path(site)
+        try:
+            age = time.time() - path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if age > getattr(self.settings, "pw_state_ttl_s", 3 * 86400):
+            # ротация: слишком старую сессию не тащим, начинаем с чистой
+            log.info("PW slot #%d: %s session expired, rotating", self.idx, site)
+            path.unlink(missing_ok=True)
+            return None
+        return str(path)
+
+    async def _new_context(self, storage_state: Optional[str]):
+        return await self.browser.new_context(
+            user_agent=UA,
             viewport={"width": 1440, "height": 920},
             locale="ru-RU", timezone_id="Europe/Moscow",
             geolocation={"latitude": 55.75, "longitude": 37.61},
             permissions=["geolocation"],
+            storage_state=storage_state,
         )
-        ctx.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
-        page = ctx.new_page()
-        page.set_default_timeout(settings.playwright_timeout_ms)
 
-        log.info("PW goto (%s): %s", site, url)
-        page.goto(url, wait_until="domcontentloaded")
-        page.wait_for_timeout(700)
-        _try_click_banners(page)
+    async def context(self, site: str):
+        ctx = self.contexts.get(site)
+        if ctx is not None:
+            return ctx
+        state = self._fresh_state(site)
+        try:
+            ctx = await self._new_context(state)
+        except Exception as e:
+            if state is None:
+                raise
+            log.info("PW slot #%d: broken %s session file, starting fresh: %s", self.idx, site, e)
+            self.state_path(site).unlink(missing_ok=True)
+            ctx = await self._new_context(None)
+        await ctx.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+        self.contexts[site] = ctx
+        self._saved_at[site] = time.monotonic()
+        if state:
+            log.info("PW slot #%d: %s session restored", self.idx, site)
+        return ctx
+
+    async def save_state(self, site: str, force: bool = False):
+        ctx = self.contexts.get(site)
+        if ctx is None:
+            return
+        every = getattr(self.settings, "pw_state_save_s", 60)
+        if not force and time.monotonic() - self._saved_at.get(site, 0) < every:
+            return
+        path = self.state_path(site)
+        try:
+            state = await ctx.storage_state()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(state), "utf-8")
+            os.replace(tmp, path)
+            self._saved_at[site] = time.monotonic()
+        except Exception as e:
+            log.debug("PW slot #%d: save %s session failed: %s", self.idx, site, e)
 
-        if site == "wb":
+    async def invalidate(self, site: str):
+        """Бан: выбрасываем контекст и сохранённую сессию сайта — следующий заход с чистого листа."""
+        ctx = self.contexts.pop(site, None)
+        if ctx is not None:
             try:
-                page.wait_for_selector("h1", timeout=7000)
+                await ctx.close()
             except Exception:
                 pass
+        self.state_path(site).unlink(missing_ok=True)
+        log.info("PW slot #%d: %s session dropped after ban page", self.idx, site)
+
+    async def close(self):
+        for site in list(self.contexts):
+            if self.healthy():
+                await self.save_state(site, force=True)
+        for obj in (*self.contexts.values(), self.browser):
             try:
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight/3)")
-                page.wait_for_timeout(500)
+                if obj is not None:
+                    await obj.close()
             except Exception:
                 pass
+        self.contexts = {}
+        self.browser = None
 
+    def healthy(self) -> bool:
         try:
-            page.wait_for_selector('script[type="application/ld+json"]', timeout=settings.wait_jsonld_ms)
+            return self.browser is not None and self.browser.is_connected()
         except Exception:
-            pass
+            return False
 
-        ld_scripts = [el.inner_text() for el in page.query_selector_all('script[type="application/ld+json"]')]
 
-        def _attr(sel):
-            el = page.query_selector(sel)
-            return el.get_attribute("content") if el else None
+class BrowserPool:
+    """
+    Пул из N тёплых браузеров на общем async-драйвере Playwright.
+    Страницы выдаются через ``async with pool.page()``; ожидающих не больше pw_queue_size.
+    """
 
-        og_title = _attr('meta[property="og:title"]') or ""
-        og_images = [n.get_attribute("content") for n in page.query_selector_all('meta[property="og:image"]') if n.get_attribute("content")]
+    def __init__(self, settings):
+        self.settings = settings
+        self.size = max(1, int(getattr(settings, "pw_pool_size", 2)))
+        self.queue_size = max(1, int(getattr(settings, "pw_queue_size", 16)))
+        self._pw = None
+        self._pw_cm = None
+        self._free: asyncio.Queue = asyncio.Queue()
+        self._slots: list[_Slot] = []
+        self._banned: set = set()  # id(page)
+        self._waiting = 0
+        self._start_lock = asyncio.Lock()
+        self._closed = False
+        self.loop = asyncio.get_running_loop()
 
-        try:
-            h1 = page.locator("h1").first.inner_text()
-        except Exception:
-            h1 = ""
+    async def start(self):
+        async with self._start_lock:
+            if self._pw is not None:
+                return
+            from playwright.async_api import async_playwright
+            self._pw_cm = async_playwright()
+            self._pw = await self._pw_cm.start()
+            for i in range(self.size):
+                slot = _Slot(i, self.settings)
+                self._slots.append(slot)
+                self._free.put_nowait(slot)
 
-        state_text = _get_state_script_text(page) if site == "wb" else None
-        composer = _fetch_ozon_composer(page) if site == "ozon" else None
+    async def _prepare(self, slot: _Slot):
+        max_pages = getattr(self.settings, "pw_recycle_pages", 50)
+        if slot.healthy() and max_pages and slot.pages_served >= max_pages:
+            log.info("PW slot #%d: recycle after %d pages", slot.idx, slot.pages_served)
+            await slot.close()
+        if not slot.healthy():
+            await slot.close()
+            await slot.launch(self._pw)
 
-        gallery_imgs = _grab_gallery_srcs(page)
+    async def _acquire(self) -> _Slot:
+        if self._closed:
+            raise RuntimeError("browser pool is closed")
+        await self.start()
+        if self._free.empty() and self._waiting >= self.queue_size:
+            raise PoolBusy("PW pool queue is full")
+        self._waiting += 1
+        try:
+            wait_s = getattr(self.settings, "pw_queue_wait_s", 10.0)
+            return await asyncio.wait_for(self._free.get(), timeout=wait_s)
+        except asyncio.TimeoutError:
+            raise PoolBusy("PW pool: no free browser") from None
+        finally:
+            self._waiting -= 1
 
-        shot = debug_dir / f"{site}_{int(time.time()*1000)}.png"
+    @contextlib.asynccontextmanager
+    async def page(self, site: str = "common"):
+        slot = await self._acquire()
+        page = None
+        ok = False
         try:
-            page.screenshot(path=str(shot), full_page=True)
-            log.info("PW screenshot saved: %s", shot)
-        except Exception as e:
-            log.debug("screenshot failed: %s", e)
+            await self._prepare(slot)
+            slot.pages_served += 1
+            page = await (await slot.context(site)).new_page()
+            yield page
+            ok = True
+        finally:
+            banned = page is not None and id(page) in self._banned
+            self._banned.discard(id(page))
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            if banned and slot.healthy():
+                await slot.invalidate(site)
+            elif ok and slot.healthy():
+                await slot.save_state(site)
+            if not slot.healthy():
+                await slot.close()
+            self._free.put_nowait(slot)
+
+    def mark_banned(self, page):
+        """Страница оказалась баном/капчей — сессию сайта в этом слоте сбросим при возврате."""
+        self._banned.add(id(page))
+
+    async def cookies(self, url: str, site: str) -> list:
+        """Куки тёплого контекста сайта — чтобы ходить в API той же сессией без браузера."""
+        for slot in self._slots:
+            ctx = slot.contexts.get(site)
+            if ctx is None or not slot.healthy():
+                continue
+            try:
+                got = await ctx.cookies(url)
+            except Exception:
+                continue
+            if got:
+                return got
+        return []
+
+    async def warm(self):
+        """Запуск всех браузеров заранее, чтобы первая ссылка не ждала Chromium."""
+        await self.start()
+
+        async def _one():
+            slot = await self._free.get()
+            try:
+                await self._prepare(slot)
+                # сохранённые сессии поднимаем сразу — первая ссылка придёт уже «своим» посетителем
+                for site in ("ozon", "wb"):
+                    await slot.context(site)
+            finally:
+                self._free.put_nowait(slot)
+
+        await asyncio.gather(*(_one() for _ in range(self.size)))
+
+    async def close(self):
+        self._closed = True
+        for slot in self._slots:
+            await slot.close()
+        if self._pw_cm is not None:
+            try:
+                await self._pw_cm.__aexit__(None, None, None)
+            except Exception:
+                pass
+        self._pw = self._pw_cm = None
 
-        html = ""
+
+_POOL: Optional[BrowserPool] = None
+
+def get_pool(settings) -> BrowserPool:
+    """Пул привязан к event loop; в новом loop (asyncio.run) создаётся заново."""
+    global _POOL
+    loop = asyncio.get_running_loop()
+    if _POOL is None or _POOL.loop is not loop or _POOL._closed:
+        _POOL = BrowserPool(settings)
+    return _POOL
+
+def _state_cookies(url: str, site: str) -> list:
+    """Куки из сохранённых storage_state сайта (свежий файл первым) — если браузер ещё не запущен."""
+    from ..config import settings
+    host = urlsplit(url).hostname or ""
+    files = sorted(pathlib.Path(settings.pw_state_dir).glob(f"{site}-*.json"),
+                   key=lambda p: p.stat().st_mtime, reverse=True)
+    now = time.time()
+    for path in files:
+        if now - path.stat().st_mtime > settings.pw_state_ttl_s:
+            continue
         try:
-            html = page.content()
+            cookies = json.loads(path.read_text("utf-8")).get("cookies") or []
         except Exception:
-            pass
+            continue
+        got = [c for c in cookies
+               if _host_in(host, (c.get("domain", "").lstrip("."),))
+               and (c.get("expires", -1) in (-1, None) or c["expires"] > now)]
+        if got:
+            return got
+    return []
 
-        final_url = page.url
-        ctx.close(); browser.close()
-
-        return {
-            "html": html,
-            "ld_scripts": ld_scripts,
-            "og_title": og_title,
-            "og_images": og_images,
-            "h1": h1,
-            "state_text": state_text,
-            "composer": composer,
-            "gallery_imgs": gallery_imgs,
-            "screenshot": str(shot),
-            "url": final_url,
-        }
+async def context_cookies(url: str, site: str) -> list:
+    """
+    Куки сайта для прямых HTTP-запросов: из живого контекста пула этого event loop,
+    иначе из сохранённой сессии на диске. Пул ради них не стартует.
+    """
+    if _POOL is not None and not _POOL._closed and _POOL.loop is asyncio.get_running_loop():
+        got = await _POOL.cookies(url, site)
+        if got:
+            return got
+    try:
+        return _state_cookies(url, site)
+    except Exception as e:
+        log.debug("state cookies for %s: %s", site, e)
+        return []
+
+async def close_pool():
+    global _POOL
+    if _POOL is not None:
+        await _POOL.close()
+        _POOL = None
 
 def _settings_or_default(settings):
     """Вернёт переданные settings или создаст дефолтные из .env/окружения."""
@@ -193,12 +667,42 @@ def _settings_or_default(settings):
         show_browser=_b("SHOW_BROWSER", False),
         slow_mo_ms=int(os.getenv("PW_SLOWMO", "0")),
         playwright_timeout_ms=int(os.getenv("PW_TIMEOUT_MS", "25000")),
-        wait_jsonld_ms=int(os.getenv("PW_WAIT_JSONLD_MS", "1200")),
+        pw_ready_ms_ozon=int(os.getenv("PW_READY_MS_OZON", "8000")),
+        pw_ready_ms_wb=int(os.getenv("PW_READY_MS_WB", "8000")),
+        pw_pool_size=int(os.getenv("PW_POOL_SIZE", "1")),
+        pw_recycle_pages=int(os.getenv("PW_RECYCLE_PAGES", "50")),
+        pw_queue_size=int(os.getenv("PW_QUEUE_SIZE", "16")),
+        pw_queue_wait_s=float(os.getenv("PW_QUEUE_WAIT_S", "10")),
+        pw_block_enabled=_b("PW_BLOCK", True),
+        pw_state_dir=os.getenv("PW_STATE_DIR", "data/pw_state"),
+        pw_state_ttl_s=float(os.getenv("PW_STATE_TTL_S", str(3 * 86400))),
+        pw_state_save_s=float(os.getenv("PW_STATE_SAVE_S", "60")),
+        pw_screenshots=os.getenv("PW_SCREENSHOTS", "fail"),
     )
 
 
-def run_get_page_data(url: str, settings, site: str):
+async def run_get_page_data_async(url: str, settings, site: str, want_html: bool = False):
+    """
+    Данные страницы: "extract" — компактная выжимка (см. parsers.extract.PageExtract),
+    "html" — полный HTML, только если want_html или выжимку получить не удалось.
+    """
     settings = _settings_or_default(settings)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-        fut = ex.submit(_run_sync_job, url, settings, site)
-        return fut.result(timeout=(settings.playwright_timeout_ms/1000)+25)
+    pool = get_pool(settings)
+    async with pool.page(site) as page:
+        res = await asyncio.wait_for(
+            _run_job(page, url, settings, site, want_html),
+            timeout=(settings.playwright_timeout_ms/1000)+25,
+        )
+        if res.get("banned"):
+            pool.mark_banned(page)
+        return res
+
+
+def run_get_page_data(url: str, settings, site: str, want_html: bool = False):
+    """Синхронная обёртка (debug_dump.py): свой event loop и временный пул."""
+    async def _once():
+        try:
+            return await run_get_page_data_async(url, settings, site, want_html)
+        finally:
+            await close_pool()
+    return asyncio.run(_once())
@@ -0,0 +1,57 @@
+
+import asyncio, logging, time
+from .config import settings
+from .db import init_db
+from .media.cache import MEDIA
+from .parsers.wb_basket import RESOLVER
+from .state.product_cache import PRODUCT_CACHE
+from .utils.http import HTTP
+from .utils.pwhelper import get_pool
+
+log = logging.getLogger("bot.warmup")
+
+def _warm_hosts() -> dict:
+    return {
+        "wb_api": ["https://card.wb.ru/"],
+        "wb_basket": [f"https://basket-{h:02d}.wbbasket.ru/" for h in RESOLVER.recent_hosts()],
+        "steam": ["https://store.steampowered.com/"],
+        "cheapshark": ["https://www.cheapshark.com/"],
+    }
+
+async def _timed(name: str, coro):
+    t0 = time.monotonic()
+    try:
+        await coro
+        log.info("warm-up %s: %.0f ms", name, (time.monotonic() - t0) * 1000)
+    except Exception as e:
+        log.warning("warm-up %s failed after %.0f ms: %s", name, (time.monotonic() - t0) * 1000, e)
+
+async def _tables():
+    RESOLVER.load()
+    await PRODUCT_CACHE.warm()
+    await MEDIA.warm()
+
+async def warm_up():
+    """Прогрев всего, за что иначе платит первый пользователь после деплоя."""
+    t0 = time.monotonic()
+    await HTTP.startup()
+    await asyncio.gather(
+        _timed("browser pool", get_pool(settings).warm()),
+        _timed("http pools", HTTP.warm(_warm_hosts())),
+        _timed("db", init_db()),
+        _timed("cache tables", _tables()),
+    )
+    log.info("warm-up done in %.0f ms", (time.monotonic() - t0) * 1000)
+
+_TASK = None
+
+async def on_startup():
+    """
+    Хук старта: ждём прогрев не дольше warmup_timeout_s, остальное догревается в фоне
+    (параллельно с уже запущенным polling).
+    """
+    global _TASK
+    _TASK = asyncio.create_task(warm_up())
+    done, _ = await asyncio.wait({_TASK}, timeout=settings.warmup_timeout_s)
+    if not done:
+        log.info("warm-up continues in background")
@@ -0,0 +1,66 @@
+
+import os, subprocess, sys
+
+# Бюджет собственного импорта bot.main (мс): кумулятивное время bot.main минус сторонние
+# пакеты из EXTERNAL. Сам aiogram грузится 3–4 с (pydantic-модели типов), и от нас это не зависит;
+# бюджет ловит то, что добавляет код бота. На медленной машине можно поднять IMPORT_BUDGET_MS.
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "150"))
+
+# Сторонние пакеты, которые bot.main импортирует намеренно; их время не входит в бюджет
+EXTERNAL = ("aiogram",)
+
+# Эти модули не должны грузиться при старте — только при первой ссылке/проверке цен или из warm-up.
+LAZY = (
+    "playwright", "httpx", "aiosqlite", "dotenv",
+    "bot.parsers", "bot.utils.pwhelper", "bot.price_providers",
+    "bot.media", "bot.db", "bot.warmup",
+)
+
+PROBE = ("import sys, bot.main; "
+         "print('\\n'.join(m for m in sys.modules if m.split('.')[0] in ('playwright','httpx','aiosqlite','dotenv','bot')))")
+
+
+def _cumulative_us(stderr: str, module: str) -> int:
+    # import time: self [us] | cumulative | imported package
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def measure():
+    """(собственное время bot.main в мс, полное время в мс, загруженные «ленивые» модули)."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    run = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=root, capture_output=True, text=True,
+    )
+    if run.returncode != 0:
+        raise RuntimeError(run.stderr)
+
+    total = _cumulative_us(run.stderr, "bot.main")
+    external = sum(_cumulative_us(run.stderr, m) for m in EXTERNAL)
+    loaded = sorted(m for m in run.stdout.split() if m.startswith(LAZY))
+    return (total - external) / 1000, total / 1000, loaded
+
+
+def main():
+    try:
+        own, total, loaded = measure()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"import bot.main: {own:.0f} ms own, {total:.0f} ms with {', '.join(EXTERNAL)} "
+          f"(budget {BUDGET_MS:.0f} ms)")
+    ok = own <= BUDGET_MS
+    if loaded:
+        print("loaded at import but should be lazy:", ", ".join(loaded))
+        ok = False
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 import sys, json, re, time
 from pathlib import Path
+from bot.config import bootstrap
 from bot.utils.pwhelper import run_get_page_data
 
 def main():
     if len(sys.argv) != 2:
         print("Usage: python debug_dump.py <url>")
         sys.exit(1)
+    bootstrap()
     url = sys.argv[1]
     site = "ozon" if "ozon.ru" in url else "wb" if "wildberries.ru" in url else "common"
-    res = run_get_page_data(url, None, site=site)
+    res = run_get_page_data(url, None, site=site, want_html=True)
 
     Path("debug").mkdir(exist_ok=True)
     ts = time.strftime("%Y%m%d_%H%M%S")
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import check_importtime  # noqa: E402
+
+pytest.importorskip("aiogram")
+
+
+@pytest.fixture(scope="module")
+def importtime():
+    return check_importtime.measure()
+
+
+def test_bot_main_import_budget(importtime):
+    own, total, _ = importtime
+    assert own <= check_importtime.BUDGET_MS, (
+        f"import bot.main: {own:.0f} ms own ({total:.0f} ms total), budget {check_importtime.BUDGET_MS:.0f} ms"
+    )
+
+
+def test_bot_main_keeps_heavy_modules_lazy(importtime):
+    _, _, loaded = importtime
+    assert not loaded, f"loaded at import but should be lazy: {', '.join(loaded)}"